@@ -2,9 +2,10 @@
 import argparse
 from dataclasses import dataclass
 from typing import Optional
+from logic import LogicParams
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AppConfig:
     """Configuración principal de la aplicación"""
     video_path: str = "data/video.mov"
@@ -13,7 +14,12 @@ class AppConfig:
     output_path: str = "data/out.mp4"
     conf_threshold: float = 0.5
     display: bool = True  # Cambiar a True por defecto
+    display_stride: int = 3  # mostrar uno de cada N frames en la ventana
     save_video: bool = True
+    debug: bool = False  # trazas por track (logging DEBUG)
+    batch_size: int = 8  # frames por inferencia batched (1 = frame a frame)
+    imgsz: int = 640  # lado de entrada de YOLO (el frame original se usa para visualizar)
+    int8: bool = False  # detector INT8 con OpenVINO en CPU
 
 
 def parse_args() -> AppConfig:
@@ -32,8 +38,18 @@ def parse_args() -> AppConfig:
                        help="Mostrar video en ventana (por defecto: True)")
     parser.add_argument("--no-display", dest="display", action="store_false",
                        help="No mostrar video en ventana")
+    parser.add_argument("--display_stride", type=int, default=3,
+                       help="Mostrar uno de cada N frames en la ventana (default: 3)")
     parser.add_argument("--events", default="data/events.csv", 
                        help="Archivo CSV para eventos")
+    parser.add_argument("--debug", action="store_true",
+                       help="Mostrar trazas de clasificación por track")
+    parser.add_argument("--batch", type=int, default=8,
+                       help="Frames por inferencia batched (1 = frame a frame)")
+    parser.add_argument("--imgsz", type=int, default=640,
+                       help="Tamaño de entrada de YOLO (múltiplo de 32)")
+    parser.add_argument("--int8", action="store_true",
+                       help="En CPU, usar el detector cuantizado INT8 con OpenVINO")
     
     args = parser.parse_args()
     
@@ -44,24 +60,27 @@ def parse_args() -> AppConfig:
         output_path=args.save_video,
         conf_threshold=args.conf,
         display=args.display,
-        save_video=bool(args.save_video)
+        display_stride=max(1, args.display_stride),
+        save_video=bool(args.save_video),
+        debug=args.debug,
+        batch_size=max(1, args.batch),
+        imgsz=max(32, args.imgsz // 32 * 32),
+        int8=args.int8
     )
 
 
-def get_detection_params():
-    """Parámetros optimizados para detección"""
-    from logic import LogicParams
-    return LogicParams(
-        conf_thr=0.5,
-        min_bbox_frac=0.001,
-        max_bbox_frac=0.09,
-        v_thr_px_s=32.0,
-        sit_seconds=2.0,
-        hist_frames=6,
-        ttl_lost=11.0,
-        min_aspect_ratio=0.35,
-        max_aspect_ratio=2.9,
-        center_weight=0.75,
-        min_stability_time=1.8,
-        max_displacement_px=75.0
-    )
+# Parámetros optimizados para detección (constante evaluada una sola vez)
+DETECTION_PARAMS = LogicParams(
+    conf_thr=0.5,
+    min_bbox_frac=0.001,
+    max_bbox_frac=0.09,
+    v_thr_px_s=32.0,
+    sit_seconds=2.0,
+    hist_frames=6,
+    ttl_lost=11.0,
+    min_aspect_ratio=0.35,
+    max_aspect_ratio=2.9,
+    center_weight=0.75,
+    min_stability_time=1.8,
+    max_displacement_px=75.0
+)
@@ -1,10 +1,183 @@
 # data_manager.py — Manejo de datos de entrada y salida
+import os
+import csv
+import json
+import queue
+import shutil
+import threading
+import subprocess
 import yaml
-import pandas as pd
 import cv2
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Tuple, Optional
 from logic import Mesa
 
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml (C), mucho más rápido
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    import av  # PyAV (opcional): decodificador multihilo de FFmpeg
+except ImportError:
+    av = None
+
+try:
+    from av.codec.hwaccel import HWAccel, hwdevices_available  # PyAV >= 14
+    # Decodificadores por hardware a probar, en orden de preferencia
+    _PYAV_HW_DEVICES = tuple(d for d in ("cuda", "videotoolbox", "vaapi", "d3d11va", "qsv")
+                             if d in hwdevices_available())
+except ImportError:
+    _PYAV_HW_DEVICES = ()
+
+# Cache de mesas parseadas por (ruta, mtime): evita re-parsear el YAML
+_MESA_CACHE: Dict[Tuple[str, float], List[Dict]] = {}
+
+# FourCC de salida, calculados una sola vez
+_FOURCC_AVC1 = cv2.VideoWriter_fourcc(*'avc1')
+_FOURCC_MP4V = cv2.VideoWriter_fourcc(*'mp4v')
+
+
+class PyAVCapture:
+    """Lector de video con PyAV que imita la interfaz read()/release() de cv2.VideoCapture"""
+    
+    def __init__(self, container):
+        self.container = container
+        self.stream = container.streams.video[0]
+        self.stream.thread_type = 'AUTO'  # decodificación en varios hilos
+        self._frames = container.decode(self.stream)
+    
+    def isOpened(self) -> bool:
+        return self.container is not None
+    
+    def read(self):
+        frame = next(self._frames, None)
+        if frame is None:
+            return False, None
+        return True, frame.to_ndarray(format='bgr24')
+    
+    def release(self) -> None:
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+class ThreadedVideoWriter:
+    """
+    Escritor de video que imita write()/release() de cv2.VideoWriter pero
+    codifica en un hilo aparte: write() solo encola el frame (bloquea si hay
+    maxsize pendientes), flush() vacía la cola y release() además cierra.
+    """
+    
+    def __init__(self, writer: cv2.VideoWriter, maxsize: int = 16):
+        self.writer = writer
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, name="video-writer", daemon=True)
+        self._thread.start()
+    
+    def _drain(self) -> None:
+        while (frame := self._queue.get()) is not None:
+            if self._error is None:
+                try:
+                    self.writer.write(frame)
+                except Exception as e:
+                    # Se reporta en el siguiente write()/release()
+                    self._error = e
+    
+    def isOpened(self) -> bool:
+        return self.writer.isOpened()
+    
+    def write(self, frame) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+    
+    def flush(self) -> None:
+        """
+        Espera a que se codifiquen todos los frames encolados y termina el
+        hilo (después solo cabe release()). Relanza, una sola vez, el error de
+        codificación del hilo: llamarlo en el camino normal, no en un finally.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+    
+    def release(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.writer.release()
+
+
+class EventLog:
+    """
+    Eventos de ocupación en columnas tipadas. Solo se registran transiciones:
+    una fila cuando una mesa cambia de ocupación o de personas sentadas
+    (estado inicial: libre, 0 personas). La capacidad se duplica al llenarse.
+    """
+    FIELDS = ('frame', 'time', 'mesa_id', 'occupied', 'people_seated')
+    
+    def __init__(self, mesa_ids: List[str], capacity: int = 1024):
+        self.mesa_ids = list(mesa_ids)
+        # Último estado registrado por mesa
+        self._last_occupied = np.zeros(len(self.mesa_ids), dtype=np.bool_)
+        self._last_seated = np.zeros(len(self.mesa_ids), dtype=np.int16)
+        n = max(1, capacity)
+        self._cols = {
+            'frame': np.empty(n, dtype=np.int32),
+            'time': np.empty(n, dtype=np.float64),
+            'mesa_id': np.empty(n, dtype=np.int16),
+            'occupied': np.empty(n, dtype=np.bool_),
+            'people_seated': np.empty(n, dtype=np.int16),
+        }
+        self._len = 0
+    
+    def __len__(self) -> int:
+        return self._len
+    
+    def append_frame(self, frame: int, t: float, occupied: List[bool], people_seated: List[int]) -> None:
+        """Registra las mesas cuyo estado cambió respecto al último registrado"""
+        occupied = np.asarray(occupied, dtype=np.bool_)
+        people_seated = np.asarray(people_seated, dtype=np.int16)
+        changed = np.flatnonzero((occupied != self._last_occupied)
+                                 | (people_seated != self._last_seated))
+        if not len(changed):
+            return
+        self._last_occupied[changed] = occupied[changed]
+        self._last_seated[changed] = people_seated[changed]
+        
+        end = self._len + len(changed)
+        if end > len(self._cols['frame']):
+            cap = max(end, 2 * len(self._cols['frame']))
+            for name, col in self._cols.items():
+                grown = np.empty(cap, dtype=col.dtype)
+                grown[:self._len] = col[:self._len]
+                self._cols[name] = grown
+        
+        rows = slice(self._len, end)
+        self._cols['frame'][rows] = frame
+        self._cols['time'][rows] = t
+        self._cols['mesa_id'][rows] = changed
+        self._cols['occupied'][rows] = occupied[changed]
+        self._cols['people_seated'][rows] = people_seated[changed]
+        self._len = end
+    
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Vistas de las columnas ya escritas (mesa_id como índice en mesa_ids)"""
+        return {name: col[:self._len] for name, col in self._cols.items()}
+    
+    def rows(self):
+        """Filas como tuplas en el orden de FIELDS, con los tipos de Python"""
+        cols = self.columns()
+        mesa_ids = self.mesa_ids
+        return zip(cols['frame'].tolist(), cols['time'].tolist(),
+                   [mesa_ids[i] for i in cols['mesa_id'].tolist()],
+                   cols['occupied'].tolist(), cols['people_seated'].tolist())
+
 
 class DataManager:
     """Gestiona la carga y guardado de datos del sistema"""
@@ -12,14 +185,15 @@ class DataManager:
     @staticmethod
     def load_mesas(filepath: str) -> List[Mesa]:
         """Cargar configuración de mesas desde archivo YAML"""
-        with open(filepath, 'r') as f:
-            data = yaml.safe_load(f)
+        key = (filepath, os.path.getmtime(filepath))
+        tables = _MESA_CACHE.get(key)
+        if tables is None:
+            tables = DataManager._load_tables(filepath)
+            _MESA_CACHE[key] = tables
         
+        # Las Mesa guardan estado mutable: se construyen nuevas en cada llamada
         mesas = []
-        # El archivo puede usar 'tables' o 'mesas'
-        tables_key = 'tables' if 'tables' in data else 'mesas'
-        
-        for mesa_data in data[tables_key]:
+        for mesa_data in tables:
             mesa = Mesa(
                 id=mesa_data['id'],
                 polygon=mesa_data['polygon'],
@@ -30,31 +204,159 @@ class DataManager:
         
         return mesas
     
+    @staticmethod
+    def _load_tables(filepath: str) -> List[Dict]:
+        """Leer tablas del YAML, usando un sidecar JSON si está al día"""
+        cache_path = filepath + '.cache.json'
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(filepath):
+            try:
+                with open(cache_path, 'r') as f:
+                    return json.load(f)
+            except ValueError:
+                pass  # sidecar corrupto (JSONDecodeError): se regenera desde el YAML
+        
+        with open(filepath, 'r') as f:
+            data = yaml.load(f, Loader=SafeLoader)
+        
+        # El archivo puede usar 'tables' o 'mesas'
+        tables_key = 'tables' if 'tables' in data else 'mesas'
+        tables = data[tables_key]
+        
+        # JSON se carga un orden de magnitud más rápido que YAML. Se escribe
+        # en un temporal y se reemplaza: una escritura cortada no deja un sidecar truncado
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(tables, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # directorio de solo lectura o disco lleno: seguimos sin sidecar
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        
+        return tables
+    
     @staticmethod
     def get_video_info(video_path: str) -> Dict[str, Any]:
         """Obtener información del video"""
+        if av is not None:
+            info = DataManager._get_video_info_pyav(video_path)
+            if info is not None:
+                return info
+        
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             raise ValueError(f"No se pudo abrir el video: {video_path}")
         
+        # CAP_PROP_FRAME_COUNT no es confiable en todos los codecs
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total_frames <= 0:
+            total_frames = (DataManager.container_frame_count_via_ffprobe(video_path)
+                            or DataManager._count_frames_manual(video_path))
+        
         info = {
             'fps': cap.get(cv2.CAP_PROP_FPS),
             'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
             'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
-            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'total_frames': total_frames,
             'cap': cap
         }
         
         return info
     
     @staticmethod
-    def save_events(events: List[Dict], filepath: str) -> None:
-        """Guardar eventos en archivo CSV"""
-        df_events = pd.DataFrame(events)
-        df_events.to_csv(filepath, index=False)
+    def _open_pyav(video_path: str):
+        """
+        Abre el video con PyAV decodificando por hardware (NVDEC, VAAPI,
+        VideoToolbox...) si hay un dispositivo utilizable; si no, en software.
+        Los frames se descargan a memoria del sistema: el detector recibe
+        arrays BGR igual que con la decodificación software.
+        """
+        for device_type in _PYAV_HW_DEVICES:
+            try:
+                return av.open(video_path, hwaccel=HWAccel(device_type=device_type,
+                                                           allow_software_fallback=True))
+            except av.error.FFmpegError:
+                continue
+        return av.open(video_path)
+    
+    @staticmethod
+    def _get_video_info_pyav(video_path: str) -> Optional[Dict[str, Any]]:
+        """Información del video usando PyAV; None si no se puede abrir"""
+        try:
+            cap = PyAVCapture(DataManager._open_pyav(video_path))
+        except (av.error.FFmpegError, IndexError):
+            return None
+        
+        stream = cap.stream
+        # stream.frames viene del índice del contenedor (0 si no lo declara)
+        total_frames = stream.frames
+        if total_frames <= 0:
+            total_frames = (DataManager.container_frame_count_via_ffprobe(video_path)
+                            or DataManager._count_frames_manual(video_path))
+        
+        return {
+            'fps': float(stream.average_rate or 0),
+            'width': stream.codec_context.width,
+            'height': stream.codec_context.height,
+            'total_frames': total_frames,
+            'cap': cap
+        }
+    
+    @staticmethod
+    def container_frame_count_via_ffprobe(video_path: str) -> Optional[int]:
+        """Número de frames según el índice del contenedor (sin decodificar), si ffprobe existe"""
+        if shutil.which('ffprobe') is None:
+            return None
+        try:
+            out = subprocess.run(
+                ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                 '-show_entries', 'stream=nb_frames',
+                 '-of', 'default=nokey=1:noprint_wrappers=1', video_path],
+                capture_output=True, text=True, timeout=10
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return int(out) if out.isdigit() and int(out) > 0 else None
+    
+    @staticmethod
+    def _count_frames_manual(video_path: str) -> int:
+        """Contar frames decodificando el video completo (solo para codecs sin metadata)"""
+        cap = cv2.VideoCapture(video_path)
+        total = 0
+        while cap.grab():
+            total += 1
+        cap.release()
+        return total
+    
+    @staticmethod
+    def save_events(events, filepath: str) -> None:
+        """Guardar eventos (EventLog o lista de dicts) en archivo CSV"""
+        if not len(events):
+            open(filepath, 'w').close()
+            return
+        with open(filepath, 'w', newline='') as f:
+            if isinstance(events, EventLog):
+                writer = csv.writer(f)
+                writer.writerow(EventLog.FIELDS)
+                writer.writerows(events.rows())
+                return
+            writer = csv.DictWriter(f, fieldnames=list(events[0].keys()))
+            writer.writeheader()
+            writer.writerows(events)
     
     @staticmethod
-    def setup_video_writer(output_path: str, fps: float, width: int, height: int) -> cv2.VideoWriter:
-        """Configurar el escritor de video"""
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        return cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    def setup_video_writer(output_path: str, fps: float, width: int, height: int) -> ThreadedVideoWriter:
+        """
+        Configurar el escritor de video. Intenta H.264 ('avc1', que FFmpeg
+        puede servir con un encoder por hardware); si el backend no lo
+        soporta, vuelve al encoder software 'mp4v'. La codificación corre
+        en un hilo aparte, fuera del bucle de procesamiento.
+        """
+        writer = cv2.VideoWriter(output_path, cv2.CAP_FFMPEG, _FOURCC_AVC1, fps, (width, height))
+        if not writer.isOpened():
+            writer.release()
+            writer = cv2.VideoWriter(output_path, _FOURCC_MP4V, fps, (width, height))
+        return ThreadedVideoWriter(writer)
@@ -1,3 +1,4 @@
-from .person_detector import PersonDetector
+from .person_detector import PersonDetector, get_detector
+from .detections import Detections
 
-__all__ = ['PersonDetector']
+__all__ = ['PersonDetector', 'Detections', 'get_detector']
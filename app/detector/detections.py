@@ -0,0 +1,42 @@
+# detector/detections.py — Detecciones de un frame en layout SoA
+from dataclasses import dataclass, field
+import numpy as np
+
+
+@dataclass(slots=True)
+class Detections:
+    """
+    Detecciones de un frame como arrays contiguos: xyxy (N, 4), conf (N,) y
+    centers (N, 2). Indexar o iterar da la vista por detección
+    {'xyxy', 'conf'} que esperan los consumidores de listas de dicts.
+    """
+    xyxy: np.ndarray
+    conf: np.ndarray
+    centers: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.xyxy = np.asarray(self.xyxy, dtype=np.float64).reshape(-1, 4)
+        self.conf = np.asarray(self.conf, dtype=np.float64).reshape(-1)
+        self.centers = (self.xyxy[:, :2] + self.xyxy[:, 2:]) / 2.0
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        return cls(np.empty((0, 4)), np.empty(0))
+
+    @classmethod
+    def from_dicts(cls, dets) -> "Detections":
+        """Lista de dicts {'xyxy': (x1, y1, x2, y2), 'conf': float} -> Detections"""
+        return cls([d["xyxy"] for d in dets], [d["conf"] for d in dets])
+
+    def box(self, i):
+        """Caja i como tupla de floats (lo que guardan los tracks)"""
+        return tuple(self.xyxy[i].tolist())
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __getitem__(self, i):
+        return {"xyxy": self.box(i), "conf": float(self.conf[i])}
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
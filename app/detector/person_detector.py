@@ -1,21 +1,103 @@
 # detector/person_detector.py — Detector principal refactorizado
-from ultralytics import YOLO
+import os
+import importlib.util
+from functools import lru_cache
 import cv2
 import numpy as np
-from .pose_analyzer import PoseAnalyzer
+from pathlib import Path
+from .pose_analyzer import PoseAnalyzer, POSE_IMGSZ
 from .segment_validator import SegmentValidator
+from .predict import predict
+from .detections import Detections
+
+# Lote máximo del engine TensorRT exportado: las llamadas batched se parten en trozos de este tamaño
+MAX_BATCH = 16
+
+
+def _configure_threads():
+    """
+    Reparte los núcleos entre OpenCV y PyTorch para que sus pools de hilos
+    no compitan por los mismos cores.
+    """
+    import torch
+    
+    cv2.setUseOptimized(True)
+    n_cpus = os.cpu_count() or 1
+    if torch.cuda.is_available():
+        # Las entradas de pose tienen forma fija: dejar que cuDNN elija el kernel
+        torch.backends.cudnn.benchmark = True
+        # La inferencia corre en GPU: torch casi no necesita hilos de CPU
+        cv2.setNumThreads(max(1, n_cpus // 2))
+        torch.set_num_threads(1)
+    else:
+        # Solo CPU: la inferencia domina, damos todos los cores a torch
+        cv2.setNumThreads(1)
+        torch.set_num_threads(n_cpus)
+
+
+def _load_yolo(weights, imgsz, quantize=False):
+    """
+    Carga un modelo YOLO. En CUDA exporta (una sola vez) y usa un engine
+    TensorRT FP16 junto a los pesos; en CPU, con quantize y OpenVINO
+    instalado, un modelo OpenVINO INT8; si no, con onnxruntime, un modelo
+    ONNX. Si la exportación falla, usa los pesos .pt. imgsz es obligatorio:
+    debe ser el tamaño con el que se infiere, porque fija el perfil del
+    engine y va en el nombre exportado (con el lote máximo): cambiarlos re-exporta.
+    """
+    # Import diferido: ultralytics arrastra torch/CUDA y encarece el arranque
+    import torch
+    from ultralytics import YOLO
+    
+    weights_path = Path(weights)
+    if torch.cuda.is_available():
+        fmt, backend, export_kwargs = 'engine', "TensorRT", {"half": True, "batch": MAX_BATCH}
+        export_path = weights_path.with_name(f"{weights_path.stem}_{imgsz}_b{MAX_BATCH}.engine")
+    elif quantize and importlib.util.find_spec("openvino") is not None:
+        # INT8 calibrado con coco8 (lo descarga ultralytics la primera vez)
+        fmt, backend, export_kwargs = 'openvino', "OpenVINO INT8", {"int8": True, "data": "coco8.yaml"}
+        export_path = weights_path.with_name(f"{weights_path.stem}_{imgsz}_int8_openvino_model")
+    elif importlib.util.find_spec("onnxruntime") is not None:
+        fmt, backend, export_kwargs = 'onnx', "ONNX Runtime", {}
+        export_path = weights_path.with_name(f"{weights_path.stem}_{imgsz}.onnx")
+    else:
+        return YOLO(weights)
+    
+    try:
+        if not export_path.exists():
+            print(f"🔧 Exportando {weights} a {backend} (solo la primera vez)...")
+            # dynamic para admitir las llamadas batched (frames y ROIs)
+            exported = YOLO(weights).export(format=fmt, imgsz=imgsz, dynamic=True, **export_kwargs)
+            # ultralytics exporta con el nombre de los pesos: renombrar al de esta configuración
+            os.replace(exported, export_path)
+        return YOLO(str(export_path))
+    except Exception as e:
+        print(f"⚠️  {backend} no disponible ({e}), usando {weights}")
+    return YOLO(weights)
 
 
 class PersonDetector:
     """Detector principal de personas con validación avanzada"""
     
-    def __init__(self, weights="yolov8n.pt", pose_weights="yolov8n-pose.pt", conf=0.5):
-        self.model = YOLO(weights)
+    def __init__(self, weights="yolov8n.pt", pose_weights="yolov8n-pose.pt", conf=0.5, pose_skip_conf=0.75,
+                 imgsz=640, quantize=False):
+        import torch
+        
+        _configure_threads()
+        # Solo inferencia: nunca se necesitan gradientes
+        torch.set_grad_enabled(False)
+        self._inference_mode = torch.inference_mode
+        # Lado de entrada de YOLO: el frame se reescala (letterbox) a imgsz y
+        # las cajas vuelven en coordenadas del frame original
+        self.imgsz = imgsz
+        # quantize: INT8 (OpenVINO) solo para el detector en CPU; pose sigue en FP32
+        self.model = _load_yolo(weights, imgsz, quantize=quantize)
         self.conf = conf
+        # FP16 solo en CUDA (en CPU se mantiene FP32)
+        self.half = torch.cuda.is_available()
         
-        # Cargar modelo pose
+        # Cargar modelo pose (exportado al tamaño con el que se infiere: crops de POSE_IMGSZ)
         try:
-            self.pose_model = YOLO(pose_weights)
+            self.pose_model = _load_yolo(pose_weights, POSE_IMGSZ)
             print(f"✅ YOLO Pose cargado: {pose_weights}")
         except Exception as e:
             self.pose_model = None
@@ -23,69 +105,162 @@ class PersonDetector:
             print("🔄 Usando filtro permisivo sin pose")
         
         # Inicializar componentes especializados
-        self.pose_analyzer = PoseAnalyzer(self.pose_model, conf)
-        self.segment_validator = SegmentValidator(self.model, self.pose_model, conf)
+        self.pose_analyzer = PoseAnalyzer(self.pose_model, conf, half=self.half,
+                                          pose_skip_conf=pose_skip_conf)
+        self.segment_validator = SegmentValidator(self.model, self.pose_model, conf, half=self.half)
+
+    def get_detection_params(self):
+        """Parámetros de inferencia del detector (para registrar o ajustar)"""
+        return {"conf": self.conf, "imgsz": self.imgsz, "half": self.half}
+
+    def warmup(self, frame_size, batch=1, iters=2):
+        """
+        Forwards de prueba con frames negros del tamaño del video antes del
+        primer frame real: carga del engine, selección de kernels (cuDNN) y
+        reserva del allocator no caen en el procesamiento.
+        frame_size: (h, w).
+        """
+        h, w = frame_size
+        # infer_batch nunca pasa más de MAX_BATCH frames al modelo
+        frames = [np.zeros((h, w, 3), dtype=np.uint8)] * min(max(1, batch), MAX_BATCH)
+        pose_crop = np.zeros((POSE_IMGSZ, POSE_IMGSZ, 3), dtype=np.uint8)
+        with self.inference_mode():
+            for _ in range(iters):
+                predict(self.model, frames, conf=self.conf, classes=[0], imgsz=self.imgsz,
+                        half=self.half, verbose=False)
+                if self.pose_model is not None:
+                    predict(self.pose_model, pose_crop, imgsz=POSE_IMGSZ, half=self.half, verbose=False)
+
+    def inference_mode(self):
+        """Contexto torch.inference_mode compartido por todas las llamadas de un frame"""
+        return self._inference_mode()
+
+    def process_frame(self, frame, rois=None):
+        """
+        Ejecuta todas las detecciones del frame dentro de un único
+        inference_mode: frame completo y, si se pasan, los ROIs precalculados.
+        Devuelve (global_dets, roi_dets).
+        """
+        with self.inference_mode():
+            global_dets = self.infer(frame)
+            roi_dets = self.infer_rois(frame, rois) if rois else Detections.empty()
+        return global_dets, roi_dets
 
     def infer(self, frame):
         """Detección básica de personas en frame completo"""
-        res = self.model.predict(frame, conf=self.conf, classes=[0], verbose=False)[0]
+        res = predict(self.model, frame, conf=self.conf, classes=[0], imgsz=self.imgsz,
+                      half=self.half, verbose=False)[0]
+        return self._to_dets(res)
+
+    def infer_batch(self, frames):
+        """
+        Detección en varios frames completos con forward passes batched de
+        hasta MAX_BATCH frames (el máximo del engine TensorRT)
+        """
+        frames = list(frames)
         dets = []
-        if res and res.boxes is not None and len(res.boxes):
-            xyxy = res.boxes.xyxy.cpu().numpy()
-            confs = res.boxes.conf.cpu().numpy()
-            for (x1, y1, x2, y2), c in zip(xyxy, confs):
-                dets.append({"xyxy": (float(x1), float(y1), float(x2), float(y2)), "conf": float(c)})
+        for i in range(0, len(frames), MAX_BATCH):
+            results = predict(self.model, frames[i:i + MAX_BATCH], conf=self.conf, classes=[0],
+                              imgsz=self.imgsz, half=self.half, verbose=False)
+            dets.extend(self._to_dets(res) for res in results)
         return dets
 
-    def infer_roi(self, frame, roi_polygon):
-        """Detección de personas dentro de un ROI específico"""
-        # Obtener bounding box del ROI
-        roi_points = np.array(roi_polygon, dtype=np.int32)
+    @staticmethod
+    def _to_dets(res):
+        """Resultado YOLO de un frame -> Detections (arrays, sin un dict por caja)"""
+        if not (res and res.boxes is not None and len(res.boxes)):
+            return Detections.empty()
+        # Una sola sincronización GPU->CPU: filas (x1, y1, x2, y2, conf, cls)
+        boxes = res.boxes.data.cpu().numpy()
+        return Detections(boxes[:, :4], boxes[:, 4])
+
+    @staticmethod
+    def roi_bounds(roi_polygon, frame_size, padding=50):
+        """
+        Bounding box del ROI expandido con padding y recortado al frame.
+        frame_size: (h, w). Devuelve (x_min, y_min, x_max, y_max) o None si
+        el ROI es demasiado pequeño. Los polígonos son estáticos, así que esto
+        se calcula una vez por mesa y se reutiliza en todos los frames.
+        """
+        roi_points = np.asarray(roi_polygon, dtype=np.int32)
         x_min, y_min = roi_points.min(axis=0)
         x_max, y_max = roi_points.max(axis=0)
         
-        # Expandir ROI con padding
-        padding = 50
-        h, w = frame.shape[:2]
-        x_min = max(0, x_min - padding)
-        y_min = max(0, y_min - padding)
-        x_max = min(w, x_max + padding)
-        y_max = min(h, y_max + padding)
+        h, w = frame_size
+        x_min = max(0, int(x_min) - padding)
+        y_min = max(0, int(y_min) - padding)
+        x_max = min(w, int(x_max) + padding)
+        y_max = min(h, int(y_max) + padding)
         
         # Validar tamaño del ROI
         if x_max - x_min < 100 or y_max - y_min < 100:
-            return []
+            return None
+        return (x_min, y_min, x_max, y_max)
+
+    @classmethod
+    def mesa_roi_bounds(cls, mesa, frame_size):
+        """
+        roi_bounds() del polígono de la mesa, guardado en la mesa junto al
+        tamaño de frame para el que vale (mesa.roi_frame_size): se recalcula
+        solo si cambia el tamaño, también cuando el ROI es demasiado pequeño (None).
+        """
+        frame_size = tuple(frame_size[:2])
+        if mesa.roi_frame_size != frame_size:
+            mesa.roi_bounds = cls.roi_bounds(mesa.poly_np, frame_size)
+            mesa.roi_frame_size = frame_size
+        return mesa.roi_bounds
+
+    def infer_roi(self, frame, roi_polygon):
+        """Detección de personas dentro de un ROI específico"""
+        return self.infer_rois(frame, [self.roi_bounds(roi_polygon, frame.shape[:2])])
+
+    def infer_mesa_roi(self, frame, mesa):
+        """Como infer_roi, pero con los bounds guardados en la mesa (ver mesa_roi_bounds)"""
+        return self.infer_rois(frame, [self.mesa_roi_bounds(mesa, frame.shape)])
+
+    def infer_rois(self, frame, rois):
+        """
+        Detección de personas en varios ROIs con una sola llamada batched a YOLO.
+        rois: lista de bounds precalculados con roi_bounds() (None se ignora)
+        """
+        crops, offsets = [], []
+        for bounds in rois:
+            if bounds is None:
+                continue
+            x_min, y_min, x_max, y_max = bounds
+            crops.append(frame[y_min:y_max, x_min:x_max])
+            offsets.append((x_min, y_min))
         
-        # Extraer y procesar ROI
-        roi_frame = frame[y_min:y_max, x_min:x_max]
+        if not crops:
+            return Detections.empty()
         
-        try:
-            roi_results = self.model.predict(roi_frame, conf=self.conf, classes=[0], verbose=False)[0]
-            
-            dets = []
-            if roi_results and roi_results.boxes is not None and len(roi_results.boxes):
-                xyxy = roi_results.boxes.xyxy.cpu().numpy()
-                confs = roi_results.boxes.conf.cpu().numpy()
-                
-                for (x1, y1, x2, y2), c in zip(xyxy, confs):
-                    # Ajustar coordenadas al frame completo
-                    abs_x1 = x1 + x_min
-                    abs_y1 = y1 + y_min
-                    abs_x2 = x2 + x_min
-                    abs_y2 = y2 + y_min
-                    
-                    # Filtrar usando análisis de pose para ROI de mesa
-                    if self.pose_analyzer.has_head_or_torso_in_roi(roi_frame, x1, y1, x2, y2):
-                        dets.append({
-                            "xyxy": (abs_x1, abs_y1, abs_x2, abs_y2), 
-                            "conf": float(c)
-                        })
-            
-            return dets
-            
-        except Exception as e:
-            print(f"Error en detección ROI: {e}")
-            return []
+        # Forward passes batched para todos los ROIs del frame (hasta MAX_BATCH por llamada)
+        roi_results = []
+        for i in range(0, len(crops), MAX_BATCH):
+            roi_results.extend(predict(self.model, crops[i:i + MAX_BATCH], conf=self.conf, classes=[0],
+                                       half=self.half, verbose=False))
+        
+        # Recortar cada persona una sola vez: YOLO ya devuelve cajas dentro del ROI
+        candidates, roi_dets = [], []
+        for roi_frame, (x_min, y_min), res in zip(crops, offsets, roi_results):
+            if not (res and res.boxes is not None and len(res.boxes)):
+                continue
+            roi_height = roi_frame.shape[0]
+            boxes = res.boxes.data.cpu().numpy()
+            for x1, y1, x2, y2, c in boxes[:, :5]:
+                top = int(y1)
+                candidates.append((roi_frame[top:int(y2), int(x1):int(x2)], top, roi_height))
+                # Ajustar coordenadas al frame completo
+                roi_dets.append({
+                    "xyxy": (float(x1 + x_min), float(y1 + y_min), float(x2 + x_min), float(y2 + y_min)),
+                    "conf": float(c)
+                })
+        
+        # Filtrar usando análisis de pose para ROI de mesa (también batched)
+        keep = self.pose_analyzer.has_head_or_torso_in_crops(
+            candidates, confs=[det["conf"] for det in roi_dets]
+        )
+        return Detections.from_dicts([det for det, ok in zip(roi_dets, keep) if ok])
 
     def validate_person_segment(self, frame, bbox):
         """Validación secundaria de segmentos (delega al validador especializado)"""
@@ -109,3 +284,13 @@ class PersonDetector:
     def _has_head_or_torso_in_mesa_roi(self, roi_frame, x1, y1, x2, y2):
         """Método legacy - delega al pose analyzer"""
         return self.pose_analyzer.has_head_or_torso_in_roi(roi_frame, x1, y1, x2, y2)
+
+
+@lru_cache(maxsize=1)
+def get_detector(conf=0.5, imgsz=640, quantize=False):
+    """
+    PersonDetector compartido: cargar los modelos domina el arranque, así
+    que construirlo de nuevo con los mismos parámetros devuelve la misma
+    instancia (la de la última configuración pedida).
+    """
+    return PersonDetector(conf=conf, imgsz=imgsz, quantize=quantize)
@@ -1,103 +1,159 @@
 # detector/pose_analyzer.py — Análisis con YOLO Pose
+from functools import lru_cache
+import cv2
 import numpy as np
+from .predict import predict
+
+# Índices de keypoints COCO agrupados por región del cuerpo
+HEAD_IDX = np.array([0, 1, 2, 3, 4])             # nariz, ojos, orejas
+SHOULDER_IDX = np.array([5, 6])                  # hombros
+TORSO_IDX = np.array([5, 6, 7, 8, 9, 10])        # hombros, codos, muñecas
+HIP_IDX = np.array([11, 12])                     # caderas
+KNEE_IDX = np.array([13, 14])                    # rodillas
+ANKLE_IDX = np.array([15, 16])                   # tobillos
+LOWER_IDX = np.array([11, 12, 13, 14, 15, 16])   # caderas, rodillas, tobillos
+
+# Tamaño fijo de entrada para YOLO Pose: una sola forma permite a cuDNN
+# reutilizar el mismo kernel autoajustado en todas las llamadas
+POSE_IMGSZ = 192
+
+
+def to_pose_input(crop, size=POSE_IMGSZ):
+    """
+    Escala el recorte (manteniendo proporción) y lo rellena a size x size.
+    El relleno va abajo/derecha, así que los keypoints vuelven a coordenadas
+    del recorte dividiendo por la escala devuelta.
+    """
+    h, w = crop.shape[:2]
+    scale = size / max(h, w)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    canvas = np.zeros((size, size, 3), dtype=crop.dtype)
+    canvas[:new_h, :new_w] = cv2.resize(crop, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale
+
+
+# Paso de cuantización (px) para memoizar el filtro geométrico: las cajas de
+# personas quietas se repiten casi idénticas frame a frame
+GEOM_QUANT = 8
+
+
+def _quantize(value):
+    return int(round(value / GEOM_QUANT)) * GEOM_QUANT
+
+
+@lru_cache(maxsize=4096)
+def _geometric_head_torso(top, bbox_height, bbox_width, roi_height):
+    """Filtro geométrico MUY ESTRICTO contra piernas/pies (claves cuantizadas)"""
+    aspect_ratio = bbox_height / max(bbox_width, 1e-6)
+    if aspect_ratio < 1.5:
+        return False
+    
+    relative_top = top / roi_height
+    if relative_top > 0.5:
+        return False
+    
+    height_ratio = bbox_height / roi_height
+    if height_ratio < 0.4:
+        return False
+    
+    if relative_top > 0.3 and aspect_ratio < 2.0:
+        return False
+    
+    return True
 
 
 class PoseAnalyzer:
     """Maneja todo el análisis de pose usando YOLO Pose"""
     
-    def __init__(self, pose_model, conf_threshold=0.5):
+    def __init__(self, pose_model, conf_threshold=0.5, half=False, pose_skip_conf=0.75):
         self.pose_model = pose_model
         self.conf = conf_threshold
+        self.half = half
+        # Detecciones con confianza >= este umbral que pasan los filtros
+        # geométricos se aceptan sin ejecutar YOLO Pose
+        self.pose_skip_conf = pose_skip_conf
     
     def has_head_or_torso_in_roi(self, roi_frame, x1, y1, x2, y2):
         """
         Filtro ESTRICTO para ROI de mesa: NO contar solo pies dentro del polígono.
         Solo acepta detecciones que incluyan cabeza/torso/brazos, rechaza solo piernas/pies.
         """
+        roi_height, roi_width = roi_frame.shape[:2]
+        y1_int, y2_int = max(0, int(y1)), min(roi_height, int(y2))
+        x1_int, x2_int = max(0, int(x1)), min(roi_width, int(x2))
+        person_crop = roi_frame[y1_int:y2_int, x1_int:x2_int]
+        return self.has_head_or_torso_in_crops([(person_crop, y1_int, roi_height)])[0]
+
+    def has_head_or_torso_in_crops(self, candidates, confs=None):
+        """
+        Versión batched de has_head_or_torso_in_roi sobre recortes ya extraídos.
+        candidates: lista de (person_crop, top, roi_height) -> lista de bool,
+        donde top es la coordenada y del recorte dentro del ROI.
+        Cascada: primero los filtros geométricos (baratos); si se pasan las
+        confianzas de YOLO, las detecciones muy seguras se aceptan directo y
+        solo las dudosas se envían a YOLO Pose, en una sola llamada.
+        """
         if self.pose_model is None:
-            return self._geometric_head_torso_check(roi_frame, x1, y1, x2, y2)
+            return [self._geometric_head_torso_check(top, *crop.shape[:2], roi_height)
+                    for crop, top, roi_height in candidates]
         
-        try:
-            y1_int, y2_int = max(0, int(y1)), min(roi_frame.shape[0], int(y2))
-            x1_int, x2_int = max(0, int(x1)), min(roi_frame.shape[1], int(x2))
-            
-            det_height = y2_int - y1_int
-            det_width = x2_int - x1_int
-            roi_height, roi_width = roi_frame.shape[:2]
-            
-            # Filtros geométricos previos
-            if not self._passes_geometric_filters(det_height, det_width, roi_height, y1_int):
-                return False
-            
-            det_frame = roi_frame[y1_int:y2_int, x1_int:x2_int]
-            if det_frame.size == 0:
-                return False
-
-            # Ejecutar YOLO Pose
-            pose_results = self.pose_model.predict(det_frame, conf=self.conf * 0.3, verbose=False)[0]
-            
-            if pose_results and pose_results.keypoints is not None and len(pose_results.keypoints):
-                return self._analyze_keypoints_for_mesa(pose_results)
-            
-            return False
-            
-        except Exception:
-            return self._geometric_head_torso_check(roi_frame, x1, y1, x2, y2)
-
-    def _passes_geometric_filters(self, det_height, det_width, roi_height, y1_int):
-        """Filtros geométricos para rechazar formas típicas de solo pies/piernas"""
-        aspect_ratio = det_height / max(det_width, 1e-6)
-        relative_top = y1_int / roi_height
-        relative_height = det_height / roi_height
+        results = [False] * len(candidates)
+        pending, crops = [], []
         
-        # RECHAZAR si está muy abajo en el ROI
-        if relative_top > 0.7:
-            return False
-            
-        # RECHAZAR si es muy pequeño
-        if relative_height < 0.3:
-            return False
-            
-        # RECHAZAR formas anchas y bajas típicas de pies
-        if aspect_ratio < 1.2 and relative_top > 0.5:
-            return False
-            
-        # RECHAZAR detecciones muy pequeñas en la parte inferior
-        if det_height < 60 and relative_top > 0.6:
-            return False
-            
-        # RECHAZAR detecciones muy bajas
-        if det_height < 80:
-            return False
+        for i, (person_crop, top, roi_height) in enumerate(candidates):
+            det_height, det_width = person_crop.shape[:2]
+            
+            # Filtros geométricos previos contra formas típicas de solo pies/piernas:
+            # no muy abajo en el ROI, no muy pequeño, no ancho y bajo, altura mínima
+            # (altura >= 80 y ancho >= 15 garantizan además un recorte no vacío)
+            aspect_ratio = det_height / max(det_width, 1e-6)
+            relative_top = top / roi_height
+            relative_height = det_height / roi_height
+            if not (relative_top <= 0.7
+                    and relative_height >= 0.3
+                    and not (aspect_ratio < 1.2 and relative_top > 0.5)
+                    and det_height >= 80
+                    and det_width >= 15):
+                continue
+            
+            if confs is not None and confs[i] >= self.pose_skip_conf:
+                results[i] = True
+                continue
+            
+            pending.append(i)
+            crops.append(to_pose_input(person_crop)[0])
         
-        # Filtro básico de tamaño
-        if det_height < 30 or det_width < 15:
-            return False
-            
-        return True
+        if not crops:
+            return results
+        
+        # Ejecutar YOLO Pose una sola vez para todas las detecciones
+        pose_batch = predict(self.pose_model, crops, conf=self.conf * 0.3, imgsz=POSE_IMGSZ,
+                             half=self.half, verbose=False)
+        
+        for i, pose_results in zip(pending, pose_batch):
+            if pose_results and pose_results.keypoints is not None and len(pose_results.keypoints):
+                results[i] = self._analyze_keypoints_for_mesa(pose_results)
+        
+        return results
 
     def _analyze_keypoints_for_mesa(self, pose_results):
         """Analiza keypoints específicamente para detección en mesa"""
-        keypoints = pose_results.keypoints.xy.cpu().numpy()
-        confidences = pose_results.keypoints.conf.cpu().numpy()
+        # Una sola sincronización: (N, 17, 3) con x, y, conf
+        kpts_data = pose_results.keypoints.data.cpu().numpy()
+        keypoints, confidences = kpts_data[..., :2], kpts_data[..., 2]
         
         for person_kpts, person_confs in zip(keypoints, confidences):
-            # Categorizar keypoints por región del cuerpo
-            head_kpts = [0, 1, 2, 3, 4]  # nariz, ojos, orejas
-            torso_kpts = [5, 6, 7, 8, 9, 10]  # hombros, codos, muñecas
-            lower_kpts = [11, 12, 13, 14, 15, 16]  # caderas, rodillas, tobillos
-            
-            head_count = sum(1 for idx in head_kpts if person_confs[idx] > 0.3)
-            torso_count = sum(1 for idx in torso_kpts if person_confs[idx] > 0.3)
-            lower_count = sum(1 for idx in lower_kpts if person_confs[idx] > 0.3)
+            # Contar keypoints visibles por región del cuerpo
+            head_count = int((person_confs[HEAD_IDX] > 0.3).sum())
+            torso_count = int((person_confs[TORSO_IDX] > 0.3).sum())
+            lower_count = int((person_confs[LOWER_IDX] > 0.3).sum())
             
             # RECHAZAR si SOLO detecta parte inferior
             if lower_count >= 1 and head_count == 0 and torso_count == 0:
                 return False
             
             # RECHAZAR si detecta principalmente tobillos/pies sin contexto superior
-            ankle_kpts = [15, 16]
-            ankle_count = sum(1 for idx in ankle_kpts if person_confs[idx] > 0.3)
+            ankle_count = int((person_confs[ANKLE_IDX] > 0.3).sum())
             if ankle_count >= 1 and head_count == 0 and torso_count <= 1:
                 return False
                 
@@ -107,28 +163,10 @@ class PoseAnalyzer:
                 
         return False
 
-    def _geometric_head_torso_check(self, roi_frame, x1, y1, x2, y2):
-        """Filtro geométrico MUY ESTRICTO contra piernas/pies"""
-        bbox_height = y2 - y1
-        bbox_width = x2 - x1
-        roi_height, roi_width = roi_frame.shape[:2]
-        
-        aspect_ratio = bbox_height / max(bbox_width, 1e-6)
-        if aspect_ratio < 1.5:
-            return False
-        
-        relative_top = y1 / roi_height
-        if relative_top > 0.5:
-            return False
-        
-        height_ratio = bbox_height / roi_height
-        if height_ratio < 0.4:
-            return False
-        
-        if relative_top > 0.3 and aspect_ratio < 2.0:
-            return False
-        
-        return True
+    def _geometric_head_torso_check(self, top, bbox_height, bbox_width, roi_height):
+        """Filtro geométrico MUY ESTRICTO contra piernas/pies (memoizado)"""
+        return _geometric_head_torso(_quantize(top), _quantize(bbox_height),
+                                     _quantize(bbox_width), int(roi_height))
 
     def is_person_standing_with_feet_visible(self, frame, bbox):
         """Determina si una persona está de pie Y tiene pies visibles"""
@@ -137,50 +175,45 @@ class PoseAnalyzer:
             aspect_ratio = (y2 - y1) / max(x2 - x1, 1e-6)
             return aspect_ratio > 2.0
         
-        try:
-            x1, y1, x2, y2 = bbox
-            h, w = frame.shape[:2]
-            
-            # Expandir para mejor análisis
-            padding = 10
-            x1_exp = max(0, int(x1) - padding)
-            y1_exp = max(0, int(y1) - padding)
-            x2_exp = min(w, int(x2) + padding)
-            y2_exp = min(h, int(y2) + padding)
-            
-            person_frame = frame[y1_exp:y2_exp, x1_exp:x2_exp]
-            if person_frame.size == 0:
-                return False
-            
-            pose_results = self.pose_model.predict(person_frame, conf=self.conf * 0.4, verbose=False)[0]
-            
-            if pose_results and pose_results.keypoints is not None and len(pose_results.keypoints):
-                return self._analyze_standing_posture(pose_results, person_frame)
-            
+        if frame is None:
             return False
-            
-        except Exception:
-            aspect_ratio = (y2 - y1) / max(x2 - x1, 1e-6)
-            return aspect_ratio > 2.8
+        
+        x1, y1, x2, y2 = bbox
+        h, w = frame.shape[:2]
+        
+        # Expandir para mejor análisis
+        padding = 10
+        x1_exp = max(0, int(x1) - padding)
+        y1_exp = max(0, int(y1) - padding)
+        x2_exp = min(w, int(x2) + padding)
+        y2_exp = min(h, int(y2) + padding)
+        
+        person_frame = frame[y1_exp:y2_exp, x1_exp:x2_exp]
+        if person_frame.size == 0:
+            return False
+        
+        pose_input, scale = to_pose_input(person_frame)
+        pose_results = predict(self.pose_model, pose_input, conf=self.conf * 0.4, imgsz=POSE_IMGSZ,
+                               half=self.half, verbose=False)[0]
+        
+        if pose_results and pose_results.keypoints is not None and len(pose_results.keypoints):
+            return self._analyze_standing_posture(pose_results, person_frame, scale)
+        
+        return False
 
-    def _analyze_standing_posture(self, pose_results, person_frame):
+    def _analyze_standing_posture(self, pose_results, person_frame, scale=1.0):
         """Analiza si la postura indica una persona de pie completa"""
-        keypoints = pose_results.keypoints.xy.cpu().numpy()
-        confidences = pose_results.keypoints.conf.cpu().numpy()
+        # Una sola sincronización: (N, 17, 3) con x, y, conf
+        kpts_data = pose_results.keypoints.data.cpu().numpy()
+        # Keypoints de vuelta a coordenadas del recorte original
+        keypoints, confidences = kpts_data[..., :2] / scale, kpts_data[..., 2]
         
         for person_kpts, person_confs in zip(keypoints, confidences):
-            # Keypoints específicos
-            ankle_kpts = [15, 16]  # tobillos
-            knee_kpts = [13, 14]   # rodillas
-            hip_kpts = [11, 12]    # caderas
-            head_kpts = [0, 1, 2, 3, 4]  # cabeza
-            shoulder_kpts = [5, 6]  # hombros
-            
-            ankles_visible = sum(1 for idx in ankle_kpts if person_confs[idx] > 0.4)
-            knees_visible = sum(1 for idx in knee_kpts if person_confs[idx] > 0.4)
-            hips_visible = sum(1 for idx in hip_kpts if person_confs[idx] > 0.4)
-            head_visible = sum(1 for idx in head_kpts if person_confs[idx] > 0.4)
-            shoulders_visible = sum(1 for idx in shoulder_kpts if person_confs[idx] > 0.4)
+            ankles_visible = int((person_confs[ANKLE_IDX] > 0.4).sum())
+            knees_visible = int((person_confs[KNEE_IDX] > 0.4).sum())
+            hips_visible = int((person_confs[HIP_IDX] > 0.4).sum())
+            head_visible = int((person_confs[HEAD_IDX] > 0.4).sum())
+            shoulders_visible = int((person_confs[SHOULDER_IDX] > 0.4).sum())
             
             # Debe tener estructura completa de persona DE PIE
             has_full_head = head_visible >= 2
@@ -194,24 +227,16 @@ class PoseAnalyzer:
 
     def _verify_vertical_alignment(self, person_kpts, person_confs, person_frame):
         """Verifica alineación vertical para confirmar postura erguida"""
-        visible_keypoints = {}
-        for idx in range(17):
-            if person_confs[idx] > 0.4:
-                visible_keypoints[idx] = person_kpts[idx]
-        
-        if len(visible_keypoints) >= 5:
-            # Obtener posiciones Y
-            head_kpts = [0, 1, 2, 3, 4]
-            shoulder_kpts = [5, 6]
-            hip_kpts = [11, 12]
-            knee_kpts = [13, 14]
-            ankle_kpts = [15, 16]
-            
-            head_y = min([visible_keypoints[i][1] for i in head_kpts if i in visible_keypoints], default=float('inf'))
-            shoulder_y = min([visible_keypoints[i][1] for i in shoulder_kpts if i in visible_keypoints], default=float('inf'))
-            hip_y = min([visible_keypoints[i][1] for i in hip_kpts if i in visible_keypoints], default=float('inf'))
-            knee_y = min([visible_keypoints[i][1] for i in knee_kpts if i in visible_keypoints], default=float('inf'))
-            ankle_y = min([visible_keypoints[i][1] for i in ankle_kpts if i in visible_keypoints], default=float('inf'))
+        visible = person_confs > 0.4
+        
+        if int(visible.sum()) >= 5:
+            # Obtener posiciones Y (mínimo entre los keypoints visibles de cada región)
+            ys = person_kpts[:, 1]
+            head_y = ys[HEAD_IDX][visible[HEAD_IDX]].min(initial=np.inf)
+            shoulder_y = ys[SHOULDER_IDX][visible[SHOULDER_IDX]].min(initial=np.inf)
+            hip_y = ys[HIP_IDX][visible[HIP_IDX]].min(initial=np.inf)
+            knee_y = ys[KNEE_IDX][visible[KNEE_IDX]].min(initial=np.inf)
+            ankle_y = ys[ANKLE_IDX][visible[ANKLE_IDX]].min(initial=np.inf)
             
             # Verificar secuencia vertical
             vertical_sequence = head_y < shoulder_y < hip_y < knee_y < ankle_y
@@ -0,0 +1,16 @@
+# detector/predict.py — Llamada a predict con reintento ante falta de memoria GPU
+
+
+def predict(model, source, **kwargs):
+    """
+    Ejecuta model.predict(source, **kwargs). Si CUDA se queda sin memoria,
+    libera la caché del allocator y reintenta una sola vez; cualquier otro
+    error se propaga para no ocultar fallos reales.
+    """
+    import torch
+    
+    try:
+        return model.predict(source, **kwargs)
+    except torch.cuda.OutOfMemoryError:
+        torch.cuda.empty_cache()
+        return model.predict(source, **kwargs)
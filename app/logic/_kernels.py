@@ -0,0 +1,176 @@
+# logic/_kernels.py — Kernels numéricos del hot path (Numba opcional)
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def _iou_matrix_numpy(boxes_a, boxes_b):
+    """IoU por pares con broadcasting de NumPy (fallback sin Numba)"""
+    ix1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    iy1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    ix2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    iy2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True, boundscheck=False)
+    def _iou_matrix_numba(boxes_a, boxes_b, out):
+        """Doble bucle escalar sin temporales: todo queda en registros"""
+        for i in range(boxes_a.shape[0]):
+            ax1, ay1, ax2, ay2 = boxes_a[i, 0], boxes_a[i, 1], boxes_a[i, 2], boxes_a[i, 3]
+            area_a = (ax2 - ax1) * (ay2 - ay1)
+            for j in range(boxes_b.shape[0]):
+                # Salida temprana si no se solapan en x o en y
+                iw = min(ax2, boxes_b[j, 2]) - max(ax1, boxes_b[j, 0])
+                if iw <= 0:
+                    out[i, j] = 0.0
+                    continue
+                ih = min(ay2, boxes_b[j, 3]) - max(ay1, boxes_b[j, 1])
+                if ih <= 0:
+                    out[i, j] = 0.0
+                    continue
+                inter = iw * ih
+                area_b = (boxes_b[j, 2] - boxes_b[j, 0]) * (boxes_b[j, 3] - boxes_b[j, 1])
+                union = area_a + area_b - inter
+                out[i, j] = inter / union if union > 0 else 0.0
+
+
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True, boundscheck=False)
+    def _rect_clip_areas_numba(poly, boxes, out):
+        """
+        Sutherland-Hodgman del polígono contra cada rectángulo (cuatro
+        semiplanos) y área por shoelace. La ventana de recorte es convexa,
+        así que el área es correcta aunque el polígono sea cóncavo.
+        """
+        n_poly = poly.shape[0]
+        cap = 16 * n_poly + 16
+        buf_a = np.empty((cap, 2), dtype=np.float64)
+        buf_b = np.empty((cap, 2), dtype=np.float64)
+        for i in range(boxes.shape[0]):
+            src, dst = buf_a, buf_b
+            for k in range(n_poly):
+                src[k, 0] = poly[k, 0]
+                src[k, 1] = poly[k, 1]
+            n = n_poly
+            for edge in range(4):
+                if n == 0:
+                    break
+                # edge 0: x >= x1, 1: x <= x2, 2: y >= y1, 3: y <= y2
+                axis = edge // 2
+                bound = boxes[i, axis + (edge % 2) * 2]
+                keep_ge = edge % 2 == 0
+                m = 0
+                px, py = src[n - 1, 0], src[n - 1, 1]
+                pv = px if axis == 0 else py
+                p_in = pv >= bound if keep_ge else pv <= bound
+                for k in range(n):
+                    qx, qy = src[k, 0], src[k, 1]
+                    qv = qx if axis == 0 else qy
+                    q_in = qv >= bound if keep_ge else qv <= bound
+                    if q_in != p_in:
+                        t = (bound - pv) / (qv - pv)
+                        if axis == 0:
+                            dst[m, 0] = bound
+                            dst[m, 1] = py + t * (qy - py)
+                        else:
+                            dst[m, 0] = px + t * (qx - px)
+                            dst[m, 1] = bound
+                        m += 1
+                    if q_in:
+                        dst[m, 0] = qx
+                        dst[m, 1] = qy
+                        m += 1
+                    px, py, pv, p_in = qx, qy, qv, q_in
+                src, dst = dst, src
+                n = m
+            area = 0.0
+            for k in range(n):
+                j = k + 1 if k + 1 < n else 0
+                area += src[k, 0] * src[j, 1] - src[j, 0] * src[k, 1]
+            out[i] = abs(area) * 0.5
+
+
+def rect_clip_areas(poly_xy, boxes):
+    """Área de intersección del polígono (V, 2) con cada caja (N, 4) xyxy (requiere Numba)"""
+    out = np.empty(boxes.shape[0], dtype=np.float64)
+    _rect_clip_areas_numba(poly_xy, boxes, out)
+    return out
+
+
+# Columnas del estado de sentado por track (una fila por track en cada mesa)
+SEAT_CAND_T, SEAT_LAST_T, SEAT_STAB_T, SEAT_STABLE, SEAT_SEATED, SEAT_X, SEAT_Y = range(7)
+SEAT_COLS = 7
+
+
+def _update_seated(state, rows, cx, cy, speed, now, v_thr, min_stab, sit_s, max_disp_sq, seated_out):
+    """
+    Máquina de estados de sentado (estabilidad, tiempo mínimo y desplazamiento)
+    para los tracks customer de una mesa. state: (R, SEAT_COLS) float64;
+    rows: fila de cada track; seated_out recibe si cada track quedó sentado.
+    """
+    for k in range(rows.shape[0]):
+        r = rows[k]
+        is_moving_slowly = speed[k] < v_thr
+        
+        if state[r, SEAT_SEATED] != 0.0:
+            # Verificar estabilidad si ya está sentado
+            dx = cx[k] - state[r, SEAT_X]
+            dy = cy[k] - state[r, SEAT_Y]
+            if dx * dx + dy * dy > max_disp_sq:
+                # Se movió demasiado, resetear
+                state[r, SEAT_SEATED] = 0.0
+                state[r, SEAT_CAND_T] = now
+                state[r, SEAT_STAB_T] = now
+                state[r, SEAT_STABLE] = 0.0
+        elif is_moving_slowly:
+            # Verificar tiempo de estabilidad
+            if state[r, SEAT_STABLE] == 0.0 and now - state[r, SEAT_STAB_T] >= min_stab:
+                state[r, SEAT_STABLE] = 1.0
+            if state[r, SEAT_STABLE] != 0.0 and now - state[r, SEAT_CAND_T] >= sit_s:
+                # Marcar como sentado
+                state[r, SEAT_SEATED] = 1.0
+                state[r, SEAT_X] = cx[k]
+                state[r, SEAT_Y] = cy[k]
+        else:
+            # Se está moviendo, resetear estabilidad
+            state[r, SEAT_STAB_T] = now
+            state[r, SEAT_STABLE] = 0.0
+            state[r, SEAT_SEATED] = 0.0
+        
+        state[r, SEAT_LAST_T] = now
+        seated_out[k] = state[r, SEAT_SEATED] != 0.0
+
+
+# Sin Numba la misma función corre como Python puro (pocos tracks por mesa)
+update_seated = njit(cache=True, boundscheck=False)(_update_seated) if HAS_NUMBA else _update_seated
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU por pares entre cajas float32 (N, 4) y (M, 4) en formato xyxy -> (N, M)"""
+    if not HAS_NUMBA:
+        return _iou_matrix_numpy(boxes_a, boxes_b)
+    out = np.empty((boxes_a.shape[0], boxes_b.shape[0]), dtype=np.float32)
+    _iou_matrix_numba(boxes_a, boxes_b, out)
+    return out
+
+
+def warmup():
+    """Fuerza la compilación JIT al arrancar, no en el primer frame real"""
+    if HAS_NUMBA:
+        dummy = np.zeros((1, 4), dtype=np.float32)
+        iou_matrix(dummy, dummy)
+        rect_clip_areas(np.zeros((3, 2), dtype=np.float64), np.zeros((1, 4), dtype=np.float64))
+        update_seated(np.zeros((1, SEAT_COLS)), np.zeros(1, dtype=np.intp), np.zeros(1), np.zeros(1),
+                      np.zeros(1), 0.0, 0.0, 0.0, 0.0, 0.0, np.zeros(1, dtype=np.bool_))
@@ -1,7 +1,10 @@
 # logic/mesa_analyzer.py — Análisis específico de estado de mesas
 import time
 from typing import Set, Dict, List
+import numpy as np
 from .models import Mesa
+from ._kernels import (iou_matrix, warmup, update_seated, SEAT_COLS,
+                       SEAT_LAST_T, SEAT_SEATED)
 
 
 class MesaAnalyzer:
@@ -9,6 +12,15 @@ class MesaAnalyzer:
     
     def __init__(self, params):
         self.params = params
+        # Umbrales fijos resueltos una vez (el bucle por frame solo lee locales)
+        self._v_thr = params.v_thr_px_s
+        self._min_stab = params.min_stability_time
+        self._sit_s = params.sit_seconds
+        # Umbral de desplazamiento al cuadrado: comparar sin raíz cuadrada
+        self._max_disp_sq = params.max_displacement_px ** 2
+        self._majority = params.hist_frames // 2 + 1
+        # Compilar kernels JIT ahora y no en el primer frame
+        warmup()
     
     def update_mesa_state(self, mesa: Mesa, tracks_for_mesa: List, now: float):
         """Actualiza el estado completo de una mesa basado en los tracks"""
@@ -16,13 +28,19 @@ class MesaAnalyzer:
         candidates_in_area: Dict[int, Dict] = {}
         staff_tracks_for_mesa = set()
         
-        # Procesar cada track
+        # Procesar cada track (métodos ligados a locales fuera del bucle)
+        customer_tracks = []
+        add_customer, add_staff = customer_tracks.append, staff_tracks_for_mesa.add
         for tr, classification, metrics in tracks_for_mesa:
             if classification == "customer":
                 candidates_in_area[tr.id] = metrics
-                self._process_customer_track(mesa, tr, now, seated_now)
+                add_customer(tr)
             elif classification == "staff":
-                staff_tracks_for_mesa.add(tr.id)
+                add_staff(tr.id)
+        
+        # Máquina de estados de sentado, en un solo kernel para todos los customers
+        if customer_tracks:
+            self._process_customer_tracks(mesa, customer_tracks, now, seated_now)
         
         # Actualizar staff tracks
         mesa.staff_tracks = staff_tracks_for_mesa
@@ -38,101 +56,74 @@ class MesaAnalyzer:
         
         return len(seated_now)
     
-    def _process_customer_track(self, mesa: Mesa, track, now: float, seated_now: Set[int]):
-        """Procesa un track de customer individual"""
-        # Obtener o crear estado del track
-        track_state = mesa.seated_tracks.get(track.id, {
-            "cand_t": now, 
-            "last_t": now, 
-            "seated": False,
-            "stability_start": now,
-            "stable": False,
-            "seated_position": None
-        })
-        
-        # Analizar movimiento
-        current_speed = track.avg_speed if hasattr(track, 'avg_speed') else track.speed
-        is_moving_slowly = current_speed < self.params.v_thr_px_s
-        
-        # Verificar estabilidad si ya está sentado
-        if track_state["seated"] and track_state["seated_position"]:
-            displacement = self._calculate_displacement(track, track_state["seated_position"])
-            if displacement > self.params.max_displacement_px:
-                # Se movió demasiado, resetear
-                track_state.update({
-                    "seated": False,
-                    "cand_t": now,
-                    "stability_start": now,
-                    "stable": False,
-                    "seated_position": None
-                })
-        elif is_moving_slowly:
-            # Verificar tiempo de estabilidad
-            stability_time = now - track_state["stability_start"]
-            
-            if not track_state["stable"] and stability_time >= self.params.min_stability_time:
-                track_state["stable"] = True
-            
-            if track_state["stable"]:
-                candidate_time = now - track_state["cand_t"]
-                if candidate_time >= self.params.sit_seconds:
-                    # Marcar como sentado
-                    track_state.update({
-                        "seated": True,
-                        "seated_position": (track.cx, track.cy)
-                    })
-        else:
-            # Se está moviendo, resetear estabilidad
-            track_state.update({
-                "stability_start": now,
-                "stable": False,
-                "seated": False,
-                "seated_position": None
-            })
-        
-        # Actualizar timestamp
-        track_state["last_t"] = now
-        mesa.seated_tracks[track.id] = track_state
-        
-        # Agregar a sentados si está marcado como sentado
-        if track_state["seated"]:
-            seated_now.add(track.id)
+    def _process_customer_tracks(self, mesa: Mesa, tracks, now: float, seated_now: Set[int]):
+        """Procesa los tracks customer de la mesa sobre el estado en arrays"""
+        rows = np.fromiter((self._seat_row(mesa, tr.id, now) for tr in tracks),
+                           dtype=np.intp, count=len(tracks))
+        cx = np.fromiter((tr.cx for tr in tracks), dtype=np.float64, count=len(tracks))
+        cy = np.fromiter((tr.cy for tr in tracks), dtype=np.float64, count=len(tracks))
+        speed = np.fromiter((tr.speed for tr in tracks), dtype=np.float64, count=len(tracks))
+        seated = np.empty(len(tracks), dtype=np.bool_)
+        
+        update_seated(mesa.seat_state, rows, cx, cy, speed, now,
+                      self._v_thr, self._min_stab, self._sit_s, self._max_disp_sq, seated)
+        
+        # Agregar a sentados los marcados como sentados
+        seated_now.update(tr.id for tr, is_seated in zip(tracks, seated) if is_seated)
     
-    def _calculate_displacement(self, track, seated_position):
-        """Calcula desplazamiento desde posición de sentado"""
-        if seated_position is None:
-            return 0
-        
-        seated_x, seated_y = seated_position
-        current_x, current_y = track.cx, track.cy
-        
-        dx = current_x - seated_x
-        dy = current_y - seated_y
-        return (dx * dx + dy * dy) ** 0.5
+    def _seat_row(self, mesa: Mesa, track_id: int, now: float) -> int:
+        """Fila del track en mesa.seat_state; la crea (estado inicial) si es nuevo"""
+        row = mesa.seated_tracks.get(track_id)
+        if row is not None:
+            return row
+        
+        if mesa.seat_state is None:
+            mesa.seat_state = np.zeros((16, SEAT_COLS), dtype=np.float64)
+            mesa.seat_free = list(range(15, -1, -1))
+        if not mesa.seat_free:
+            # Duplicar capacidad
+            n = len(mesa.seat_state)
+            mesa.seat_state = np.concatenate([mesa.seat_state, np.zeros((n, SEAT_COLS))])
+            mesa.seat_free = list(range(2 * n - 1, n - 1, -1))
+        
+        row = mesa.seat_free.pop()
+        # cand_t, last_t, stability_start = now; no estable, no sentado
+        mesa.seat_state[row] = (now, now, now, 0.0, 0.0, 0.0, 0.0)
+        mesa.seated_tracks[track_id] = row
+        return row
     
     def _cleanup_lost_tracks(self, mesa: Mesa, now: float, seated_now: Set[int]):
-        """Limpia tracks que se han perdido"""
-        for tid, state in list(mesa.seated_tracks.items()):
-            time_since_last_seen = now - state["last_t"]
-            
-            if time_since_last_seen > self.params.ttl_lost:
-                # Track perdido por mucho tiempo, eliminar
-                del mesa.seated_tracks[tid]
-            elif state.get("seated") and time_since_last_seen <= self.params.ttl_lost:
-                # Track sentado pero temporalmente perdido, mantener
-                seated_now.add(tid)
+        """Limpia tracks que se han perdido (una pasada, sin copiar ni borrar del dict)"""
+        if not mesa.seated_tracks:
+            return
+        
+        rows = np.fromiter(mesa.seated_tracks.values(), dtype=np.intp, count=len(mesa.seated_tracks))
+        lost = now - mesa.seat_state[rows, SEAT_LAST_T] > self.params.ttl_lost
+        seated = mesa.seat_state[rows, SEAT_SEATED] != 0.0
+        
+        kept = {}
+        free_row, add_seated = mesa.seat_free.append, seated_now.add
+        for (tid, row), is_lost, is_seated in zip(mesa.seated_tracks.items(), lost, seated):
+            if is_lost:
+                # Track perdido por mucho tiempo, liberar su fila
+                free_row(row)
+                continue
+            kept[tid] = row
+            if is_seated:
+                # Track sentado (quizá perdido temporalmente), mantener
+                add_seated(tid)
+        mesa.seated_tracks = kept
     
     def _update_occupancy_state(self, mesa: Mesa, seated_now: Set[int]):
         """Actualiza estado de ocupación usando histéresis"""
         # Aplicar histéresis
-        mesa.hist.append(len(seated_now) > 0)
-        if len(mesa.hist) > self.params.hist_frames:
-            mesa.hist = mesa.hist[-self.params.hist_frames:]
+        # Ventana como bitfield: desplazar, añadir el voto y descartar el más antiguo
+        mesa.hist_bits = ((mesa.hist_bits << 1) | (len(seated_now) > 0)) & mesa.hist_mask
         
-        # Determinar ocupación por mayoría de votos
-        votes_occupied = sum(mesa.hist)
+        # Determinar ocupación por mayoría de votos (popcount)
+        votes_occupied = mesa.hist_bits.bit_count()
         was_occupied = mesa.occupied
-        mesa.occupied = (votes_occupied >= self.params.hist_frames // 2 + 1)
+        mesa.occupied = (votes_occupied >= self._majority)
         mesa.people_seated = len(seated_now)
         
         # Log cambios de estado si es necesario
@@ -144,85 +135,50 @@ class MesaAnalyzer:
         """
         Combina detecciones globales y de ROI de manera inteligente
         """
-        refined_dets = []
-        used_roi_indices = set()
-        
         # Parámetros
         improvement_threshold = 0.3
         confidence_boost = 0.1
         
-        # 1. Procesar detecciones globales
-        for global_det in global_dets:
-            global_x1, global_y1, global_x2, global_y2 = global_det["xyxy"]
-            global_area = (global_x2 - global_x1) * (global_y2 - global_y1)
-            global_conf = global_det["conf"]
-            
-            best_replacement = None
-            best_iou = 0
-            best_roi_idx = -1
+        if not roi_dets:
+            return list(global_dets)
+        
+        roi_xyxy = np.asarray([d["xyxy"] for d in roi_dets], dtype=np.float32).reshape(-1, 4)
+        roi_conf = np.asarray([d["conf"] for d in roi_dets], dtype=np.float32)
+        used_roi = np.zeros(len(roi_dets), dtype=bool)
+        refined_dets = []
+        
+        if global_dets:
+            glob_xyxy = np.asarray([d["xyxy"] for d in global_dets], dtype=np.float32).reshape(-1, 4)
+            glob_conf = np.asarray([d["conf"] for d in global_dets], dtype=np.float32)
+            glob_area = (glob_xyxy[:, 2] - glob_xyxy[:, 0]) * (glob_xyxy[:, 3] - glob_xyxy[:, 1])
+            roi_area = (roi_xyxy[:, 2] - roi_xyxy[:, 0]) * (roi_xyxy[:, 3] - roi_xyxy[:, 1])
             
-            # Buscar ROI que mejore esta detección global
-            for idx, roi_det in enumerate(roi_dets):
-                if idx in used_roi_indices:
-                    continue
-                    
-                roi_x1, roi_y1, roi_x2, roi_y2 = roi_det["xyxy"]
-                roi_area = (roi_x2 - roi_x1) * (roi_y2 - roi_y1)
-                roi_conf = roi_det["conf"]
-                
-                # Calcular IoU
-                iou = self._calculate_iou(global_det["xyxy"], roi_det["xyxy"])
-                
-                if iou > improvement_threshold:
-                    # Determinar si ROI es mejor
-                    confidence_improvement = roi_conf > global_conf
-                    area_improvement = abs(roi_area - global_area) < global_area * 0.2
-                    
-                    if confidence_improvement and area_improvement and iou > best_iou:
-                        best_replacement = {
-                            "xyxy": roi_det["xyxy"],
-                            "conf": roi_conf + confidence_boost
-                        }
-                        best_iou = iou
-                        best_roi_idx = idx
+            # Matriz IoU (N, M) y criterios de mejora evaluados de una vez
+            iou = iou_matrix(glob_xyxy, roi_xyxy)
+            candidate = (
+                (iou > improvement_threshold)
+                & (roi_conf[None, :] > glob_conf[:, None])
+                & (np.abs(roi_area[None, :] - glob_area[:, None]) < glob_area[:, None] * 0.2)
+            )
             
-            # Usar la mejor detección
-            if best_replacement:
-                refined_dets.append(best_replacement)
-                used_roi_indices.add(best_roi_idx)
-            else:
-                refined_dets.append(global_det)
+            # 1. Procesar detecciones globales (greedy: cada ROI se usa una sola vez)
+            # Solo las filas con algún candidato pueden cambiar; el resto pasa tal cual
+            refined_dets = list(global_dets)
+            for i in np.flatnonzero(candidate.any(axis=1)):
+                row = np.where(candidate[i] & ~used_roi, iou[i], -1.0)
+                best_roi_idx = int(row.argmax())
+                if row[best_roi_idx] > 0:
+                    refined_dets[i] = {
+                        "xyxy": roi_dets[best_roi_idx]["xyxy"],
+                        "conf": roi_dets[best_roi_idx]["conf"] + confidence_boost
+                    }
+                    used_roi[best_roi_idx] = True
         
         # 2. Agregar detecciones ROI nuevas
-        for idx, roi_det in enumerate(roi_dets):
-            if idx not in used_roi_indices:
-                enhanced_det = {
-                    "xyxy": roi_det["xyxy"],
-                    "conf": roi_det["conf"] + confidence_boost
-                }
-                refined_dets.append(enhanced_det)
+        for idx in np.flatnonzero(~used_roi):
+            refined_dets.append({
+                "xyxy": roi_dets[idx]["xyxy"],
+                "conf": roi_dets[idx]["conf"] + confidence_boost
+            })
         
         return refined_dets
-    
-    def _calculate_iou(self, bbox1, bbox2):
-        """Calcula Intersection over Union entre dos bounding boxes"""
-        x1_1, y1_1, x2_1, y2_1 = bbox1
-        x1_2, y1_2, x2_2, y2_2 = bbox2
-        
-        # Intersección
-        inter_x1 = max(x1_1, x1_2)
-        inter_y1 = max(y1_1, y1_2)
-        inter_x2 = min(x2_1, x2_2)
-        inter_y2 = min(y2_1, y2_2)
-        
-        if inter_x2 <= inter_x1 or inter_y2 <= inter_y1:
-            return 0.0
-        
-        inter_area = (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
-        
-        # Unión
-        area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
-        area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
-        union_area = area1 + area2 - inter_area
-        
-        return inter_area / union_area if union_area > 0 else 0.0
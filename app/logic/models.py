@@ -2,28 +2,78 @@
 import time
 from dataclasses import dataclass, field
 from typing import List, Tuple, Dict, Optional, Set
+import numpy as np
 from shapely.geometry import Polygon
+from shapely.prepared import prep, PreparedGeometry
 
 
-@dataclass
+@dataclass(slots=True)
 class Mesa:
     id: str
     polygon: List[Tuple[int, int]]
     iop_thr: float = 0.12         # umbral de intersección (IoP) mesa-persona
     y_band: Optional[Tuple[int,int]] = None  # banda vertical (opcional)
     poly: Polygon = field(init=False)
-    hist: List[bool] = field(default_factory=list)
+    prepared: PreparedGeometry = field(init=False, repr=False)  # polígono indexado para contains/intersects
+    poly_np: np.ndarray = field(init=False, repr=False)  # vértices int32 para OpenCV
+    poly_xy: np.ndarray = field(init=False, repr=False)  # vértices float64 para kernels de recorte
+    area: float = field(init=False)  # geometría estática cacheada (evita llamadas a GEOS)
+    minx: float = field(init=False)
+    miny: float = field(init=False)
+    maxx: float = field(init=False)
+    maxy: float = field(init=False)
+    bbox_int: Tuple[int, int, int, int] = field(init=False)
+    centroid_px: Tuple[int, int] = field(init=False)  # centroide en píxeles (etiqueta de la mesa)
+    poly_valid: bool = field(init=False)
+    hist_bits: int = 0              # ventana de histéresis: un bit por frame (1 = ocupada)
+    hist_mask: int = (1 << 6) - 1   # bits retenidos (hist_frames)
     occupied: bool = False
     people_seated: int = 0
-    seated_tracks: Dict[int, Dict] = field(default_factory=dict)  # por track_id
+    seated_tracks: Dict[int, int] = field(default_factory=dict)  # track_id -> fila en seat_state
+    seat_state: Optional[np.ndarray] = field(default=None, repr=False)  # (R, SEAT_COLS) estado de sentado
+    seat_free: List[int] = field(default_factory=list, repr=False)  # filas libres para reutilizar
     staff_tracks: Set[int] = field(default_factory=set)  # tracks de staff (personas paradas)
     tracks_in_area: Set[int] = field(default_factory=set)  # tracks de clientes en área
+    roi_bounds: Optional[Tuple[int,int,int,int]] = None  # bbox con padding para detección ROI
+    roi_frame_size: Optional[Tuple[int,int]] = None  # (h, w) para el que vale roi_bounds; None = sin calcular
 
     def __post_init__(self):
         self.poly = Polygon([(float(x), float(y)) for x, y in self.polygon])
+        self.prepared = prep(self.poly)
+        self.poly_np = np.array(self.polygon, dtype=np.int32)
+        self.poly_xy = np.array(self.polygon, dtype=np.float64)
+        self.poly_valid = self.poly.is_valid
+        # Área (shoelace) y bounds directamente de los vértices, sin pasar por GEOS
+        xs, ys = self.poly_xy[:, 0], self.poly_xy[:, 1]
+        self.area = 0.5 * abs(float(np.dot(xs, np.roll(ys, -1)) - np.dot(ys, np.roll(xs, -1))))
+        self.minx, self.miny = (float(v) for v in self.poly_xy.min(axis=0))
+        self.maxx, self.maxy = (float(v) for v in self.poly_xy.max(axis=0))
+        (x_min, y_min), (x_max, y_max) = self.poly_np.min(axis=0), self.poly_np.max(axis=0)
+        self.bbox_int = (int(x_min), int(y_min), int(x_max), int(y_max))
+        centroid = self.poly.centroid
+        self.centroid_px = (int(centroid.x), int(centroid.y))
 
 
-@dataclass
+class TrackCache:
+    """Geometría de un track calculada una vez por frame y reutilizada en todas las mesas"""
+    __slots__ = ("tr","id","xyxy","x1","y1","x2","y2","w","h","cx","cy","ar","avg_speed","speed","rect")
+    def __init__(self, tr):
+        self.tr = tr
+        self.id = tr.id
+        self.xyxy = tr.xyxy
+        x1, y1, x2, y2 = tr.xyxy
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+        self.w, self.h = x2 - x1, y2 - y1
+        self.cx, self.cy = (x1 + x2) / 2, (y1 + y2) / 2
+        self.ar = self.h / max(self.w, 1e-6)
+        # Velocidad resuelta una sola vez (sin hasattr/getattr repetidos por mesa)
+        avg_speed = getattr(tr, 'avg_speed', None)
+        self.avg_speed = avg_speed if avg_speed is not None else 0        # clasificador
+        self.speed = avg_speed if avg_speed is not None else tr.speed     # histéresis de sentado
+        self.rect = None  # Polygon de la persona, se crea solo si hace falta
+
+
+@dataclass(slots=True)
 class LogicParams:
     conf_thr: float = 0.5              # Confianza balanceada
     min_bbox_frac: float = 0.001       # Área mínima original
@@ -1,11 +1,16 @@
 # logic/occupancy_engine.py — Motor principal de análisis de ocupación
 import time
+import logging
 from typing import List, Tuple, Set
+import numpy as np
 from shapely.geometry import Polygon
-from .models import Mesa, LogicParams
+from shapely.strtree import STRtree
+from .models import Mesa, LogicParams, TrackCache
 from .person_classifier import PersonClassifier
 from .mesa_analyzer import MesaAnalyzer
 
+_log = logging.getLogger(__name__)
+
 
 class OccupancyEngine:
     """Motor principal que coordina el análisis de ocupación"""
@@ -20,101 +25,154 @@ class OccupancyEngine:
                           for poly in (exclusions or [])]
         self.params = params or LogicParams()
         
+        for mesa in self.mesas:
+            # Ventana de histéresis con el tamaño configurado
+            mesa.hist_mask = (1 << self.params.hist_frames) - 1
+            mesa.hist_bits &= mesa.hist_mask
+        
+        # Índice espacial de mesas: solo se clasifican pares track × mesa que se tocan
+        self._mesa_tree = STRtree([mesa.poly for mesa in self.mesas])
+        
         # Inicializar componentes especializados
         self.person_classifier = PersonClassifier(detector, self.w, self.h)
         self.mesa_analyzer = MesaAnalyzer(self.params)
         
         # Frame actual para análisis
         self.current_frame = None
+        
+        # Buffer de cajas reutilizado entre frames (crece si hay más tracks)
+        self._xyxy_buf = np.empty((32, 4), dtype=np.float64)
 
-    def step(self, tracks, frame=None) -> None:
-        """Actualiza mesas usando tracks con análisis completo"""
-        now = time.time()
+    def step(self, tracks, frame=None, now=None) -> None:
+        """
+        Actualiza mesas usando tracks con análisis completo.
+        now: instante del frame (reloj monotónico); por defecto, ahora
+        """
+        # Reloj monotónico: inmune a saltos de NTP; los helpers reciben este now
+        if now is None:
+            now = time.monotonic()
         
         # Actualizar frame actual
         self.current_frame = frame
         self.person_classifier.set_current_frame(frame)
         
-        # Filtrar tracks válidos
-        valid_tracks = self._filter_valid_tracks(tracks)
+        # Layout SoA: columnas contiguas de cajas y filtro de validez vectorizado
+        xyxy = self._build_soa(tracks)
+        valid_mask = self._valid_mask(xyxy)
+        valid_idx = np.flatnonzero(valid_mask)
+        valid_tracks = [TrackCache(tracks[i]) for i in valid_idx]
+        
+        # Debug ocasional de tracks rechazados (nivel consultado una vez por frame)
+        debug = _log.isEnabledFor(logging.DEBUG)
+        if debug:
+            self._debug_rejected_tracks(tracks, np.flatnonzero(~valid_mask))
+        
+        # Rectángulos de persona construidos en bloque (Shapely 2)
+        boxes = xyxy[valid_idx]
+        rects = self.person_classifier.person_rects(boxes)
+        for tc, rect in zip(valid_tracks, rects):
+            tc.rect = rect
+        avg_speeds = np.fromiter((tc.avg_speed for tc in valid_tracks),
+                                 dtype=np.float64, count=len(valid_tracks))
+        
+        # Pares (track, mesa) cuyos polígonos se intersectan, en una sola consulta
+        track_idx, mesa_idx = self._mesa_tree.query(rects, predicate="intersects")
+        
+        # Métodos resueltos una vez: el bucle por mesa solo hace LOAD_FAST
+        basic_filter_mask = self.person_classifier.basic_filter_mask
+        classify_tracks = self._classify_tracks_for_mesa
+        update_mesa_state = self.mesa_analyzer.update_mesa_state
         
         # Procesar cada mesa
-        for mesa in self.mesas:
+        for j, mesa in enumerate(self.mesas):
+            # Un track que no toca la mesa tiene área 0 y quedaría excluido: se omite
+            idx = np.sort(track_idx[mesa_idx == j])
+            
+            # Filtros básicos en bloque (la intersección solo si pasan los baratos);
+            # los excluidos aquí se descartarían igual
+            keep, reason, inter_areas = basic_filter_mask(rects[idx], boxes[idx], avg_speeds[idx], mesa)
+            if debug and mesa.id == "01" and not keep.all():
+                self._debug_filter_reasons(mesa, reason[~keep])
+            idx = idx[keep]
+            if inter_areas is not None:
+                inter_areas = inter_areas[keep]
+            candidates = [valid_tracks[i] for i in idx]
+            
             # Clasificar tracks para esta mesa
-            tracks_for_mesa = self._classify_tracks_for_mesa(valid_tracks, mesa)
+            tracks_for_mesa = classify_tracks(candidates, mesa, inter_areas, debug)
             
             # Actualizar estado de la mesa
-            self.mesa_analyzer.update_mesa_state(mesa, tracks_for_mesa, now)
+            update_mesa_state(mesa, tracks_for_mesa, now)
 
-    def _filter_valid_tracks(self, tracks):
-        """Filtra tracks válidos para análisis"""
-        valid_tracks = []
-        rejected_tracks = []
-        
-        for tr in tracks:
-            det_dict = {"xyxy": tr.xyxy}
-            if self._is_valid_person(det_dict):
-                valid_tracks.append(tr)
-            else:
-                rejected_tracks.append(tr)
-        
-        # Debug ocasional de tracks rechazados
-        self._debug_rejected_tracks(tracks, rejected_tracks)
-        
-        return valid_tracks
+    def _build_soa(self, tracks):
+        """Cajas de todos los tracks como un único array contiguo (N, 4) float64"""
+        n = len(tracks)
+        if n > len(self._xyxy_buf):
+            self._xyxy_buf = np.empty((max(n, 2 * len(self._xyxy_buf)), 4), dtype=np.float64)
+        xyxy = self._xyxy_buf[:n]
+        for i, tr in enumerate(tracks):
+            xyxy[i] = tr.xyxy
+        return xyxy
 
-    def _is_valid_person(self, det):
-        """Validar si una detección es una persona válida"""
-        x1, y1, x2, y2 = det["xyxy"]
+    def _valid_mask(self, xyxy):
+        """Validar qué tracks son personas válidas (máscara booleana por fila)"""
+        x1, y1, x2, y2 = xyxy[:, 0], xyxy[:, 1], xyxy[:, 2], xyxy[:, 3]
         w, h = x2 - x1, y2 - y1
         area = w * h
+        aspect_ratio = h / np.maximum(w, 1e-6)
         
         # Filtros básicos de tamaño
-        min_area = self.params.min_bbox_frac * self.frame_area
-        max_area = self.params.max_bbox_frac * self.frame_area
-        if not (min_area <= area <= max_area):
-            return False
+        p = self.params
+        min_area = p.min_bbox_frac * self.frame_area
+        max_area = p.max_bbox_frac * self.frame_area
+        mask = (min_area <= area) & (area <= max_area)
         
         # Filtro de aspect ratio
-        aspect_ratio = h / max(w, 1e-6)
-        if not (self.params.min_aspect_ratio <= aspect_ratio <= self.params.max_aspect_ratio):
-            return False
+        mask &= (p.min_aspect_ratio <= aspect_ratio) & (aspect_ratio <= p.max_aspect_ratio)
         
         # Filtro de posición (evitar bordes)
-        if x1 <= 5 or y1 <= 5 or x2 >= (self.w - 5) or y2 >= (self.h - 5):
-            return False
+        mask &= (x1 > 5) & (y1 > 5) & (x2 < self.w - 5) & (y2 < self.h - 5)
         
-        return True
+        return mask
 
-    def _classify_tracks_for_mesa(self, valid_tracks, mesa):
+    def _classify_tracks_for_mesa(self, valid_tracks, mesa, inter_areas=None, debug=False):
         """Clasifica todos los tracks válidos para una mesa específica"""
         tracks_for_mesa = []
         
-        for tr in valid_tracks:
+        for i, tc in enumerate(valid_tracks):
             # Clasificar este track para esta mesa
-            classification, metrics = self.person_classifier.classify_person_in_table_area(tr, mesa)
+            classification, metrics = self.person_classifier.classify_person_in_table_area(
+                tc, mesa, intersection_area=None if inter_areas is None else float(inter_areas[i]),
+                basic_filters_applied=inter_areas is not None
+            )
             
             if classification in ["customer", "staff"]:
-                tracks_for_mesa.append((tr, classification, metrics))
+                tracks_for_mesa.append((tc, classification, metrics))
                 
                 # Debug para mesa específica
-                if mesa.id == "01" and classification == "customer":
-                    print(f"✅ Mesa {mesa.id}: Track {tr.id} clasificado como {classification}")
+                if debug and mesa.id == "01" and classification == "customer":
+                    _log.debug("✅ Mesa %s: Track %s clasificado como %s", mesa.id, tc.id, classification)
         
         return tracks_for_mesa
 
-    def _debug_rejected_tracks(self, all_tracks, rejected_tracks):
+    def _debug_filter_reasons(self, mesa, reasons):
+        """Debug de exclusiones por filtro básico (conteo por motivo)"""
+        counts = np.bincount(reasons, minlength=len(self.person_classifier.BASIC_FILTER_REASONS))
+        summary = ", ".join(f"{name}={n}" for name, n in
+                            zip(self.person_classifier.BASIC_FILTER_REASONS, counts) if n)
+        _log.debug("🚫 Mesa %s: excluidos por filtros básicos: %s", mesa.id, summary)
+
+    def _debug_rejected_tracks(self, all_tracks, rejected_idx):
         """Debug de tracks rechazados"""
-        if len(rejected_tracks) > 0 and len(all_tracks) > 0:
-            rejection_rate = len(rejected_tracks) / len(all_tracks)
+        if len(rejected_idx) > 0 and len(all_tracks) > 0:
+            rejection_rate = len(rejected_idx) / len(all_tracks)
             if rejection_rate > 0.5:  # Solo mostrar si rechazo > 50%
-                print(f"⚠️  Muchos tracks rechazados: {len(rejected_tracks)}/{len(all_tracks)} ({rejection_rate:.1%})")
-                for tr in rejected_tracks[:2]:  # Solo mostrar primeros 2
-                    x1, y1, x2, y2 = tr.xyxy
-                    w, h = x2 - x1, y2 - y1
-                    area_frac = (w * h) / self.frame_area
-                    aspect_ratio = h / max(w, 1e-6)
-                    print(f"  Track {tr.id}: área={area_frac:.4f}, aspect={aspect_ratio:.2f}")
+                _log.debug("⚠️  Muchos tracks rechazados: %d/%d (%.1f%%)",
+                           len(rejected_idx), len(all_tracks), rejection_rate * 100)
+                for i in rejected_idx[:2]:  # Solo mostrar primeros 2
+                    tc = TrackCache(all_tracks[i])
+                    area_frac = (tc.w * tc.h) / self.frame_area
+                    _log.debug("  Track %s: área=%.4f, aspect=%.2f", tc.id, area_frac, tc.ar)
 
     def combine_detections(self, global_dets, roi_dets):
         """Combina detecciones globales y ROI (delega al mesa analyzer)"""
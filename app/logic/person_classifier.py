@@ -1,62 +1,95 @@
 # logic/person_classifier.py — Clasificación de personas (customer/staff/excluded)
-from typing import Tuple, Dict
+import logging
+from typing import Tuple, Dict, Optional
+import numpy as np
+import shapely
 from shapely.geometry import Polygon, Point
+from .models import TrackCache
+from ._kernels import HAS_NUMBA, rect_clip_areas
+
+_log = logging.getLogger(__name__)
 
 
 class PersonClassifier:
     """Clasifica personas en customer, staff o excluded"""
     
+    # Umbrales de los filtros básicos (versión escalar y vectorizada)
+    MIN_AREA_PERCENTAGE = 0.08
+    MAX_AVG_SPEED = 80.0
+    # Motivos de exclusión de los filtros básicos, en orden de evaluación
+    # (los baratos primero; el área exige recortar el polígono)
+    BASIC_FILTER_REASONS = ("invalid_bbox", "moving_too_fast", "outside_y_band", "insufficient_area")
+    
     def __init__(self, detector=None, frame_w=1280, frame_h=720):
         self.detector = detector
+        # Métodos opcionales del detector, resueltos una vez (sin hasattr por track)
+        self._standing_check = getattr(detector, 'is_person_standing_with_feet_visible', None)
+        self._segment_check = getattr(detector, 'validate_person_segment', None)
+        self._mesa_roi_check = getattr(detector, '_has_head_or_torso_in_mesa_roi', None)
         self.frame_w = frame_w
         self.frame_h = frame_h
         self.current_frame = None
+        self._mesa_rois = {}
     
     def set_current_frame(self, frame):
         """Actualiza el frame actual para análisis"""
         self.current_frame = frame
+        self._mesa_rois = {}
     
-    def classify_person_in_table_area(self, track, mesa) -> Tuple[str, Dict]:
+    def classify_person_in_table_area(self, track, mesa,
+                                      intersection_area: Optional[float] = None,
+                                      basic_filters_applied: bool = False) -> Tuple[str, Dict]:
         """
         Clasifica a una persona como 'customer', 'staff' o 'excluded'
+        track: TrackCache (o un Track, que se envuelve) con la geometría del frame.
+        intersection_area: área precalculada (vectorizada por mesa); si no se
+        pasa se calcula aquí.
+        basic_filters_applied: el llamador ya aplicó basic_filter_mask, así que
+        los filtros básicos no se repiten.
         Returns: (classification, metrics_dict)
         """
-        x1, y1, x2, y2 = track.xyxy
-        w, h = x2 - x1, y2 - y1
-        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-        aspect_ratio = h / max(w, 1e-6)
-        
-        # 1. Crear rectángulo de la persona
-        person_rect = Polygon([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
-        
-        # 2. Calcular intersección con mesa
-        intersection_area = self._calculate_intersection_area(person_rect, mesa.poly)
-        person_area = person_rect.area
+        if not isinstance(track, TrackCache):
+            track = TrackCache(track)
+        y1, h = track.y1, track.h
+        cx, cy = track.cx, track.cy
+        aspect_ratio = track.ar
         
+        # 1. Área del rectángulo de la persona
+        person_area = abs(track.w * track.h)
         if person_area == 0:
             return "excluded", {"reason": "invalid_bbox"}
         
+        # 2. Descarte rápido: la caja de la persona no toca la caja de la mesa
+        if (track.x2 <= mesa.minx or track.x1 >= mesa.maxx or
+                track.y2 <= mesa.miny or track.y1 >= mesa.maxy):
+            return "excluded", {"reason": "no_bbox_overlap", "area_percentage": 0.0}
+        
+        # 3. Calcular intersección con mesa
+        if intersection_area is None:
+            intersection_area = self._calculate_intersection_area(track, mesa)
+        
         area_percentage_in_polygon = intersection_area / person_area
         
-        # 3. Filtros básicos
-        basic_filters_result = self._apply_basic_filters(
-            area_percentage_in_polygon, track, mesa, cx, cy
-        )
-        if basic_filters_result is not None:
-            return basic_filters_result
+        # 4. Filtros básicos (salvo que ya vengan aplicados en bloque)
+        if not basic_filters_applied:
+            basic_filters_result = self._apply_basic_filters(
+                area_percentage_in_polygon, track, mesa, cx, cy
+            )
+            if basic_filters_result is not None:
+                return basic_filters_result
         
-        # 4. Análisis de postura (standing vs seated)
+        # 5. Análisis de postura (standing vs seated)
         posture_result = self._analyze_posture(track, aspect_ratio, area_percentage_in_polygon)
         if posture_result is not None:
             return posture_result
         
-        # 5. Validación de segmento para personas sentadas
+        # 6. Validación de segmento para personas sentadas
         if self._is_likely_seated(aspect_ratio, track):
             segment_validation_result = self._validate_customer_segment(track, area_percentage_in_polygon)
             if segment_validation_result is not None:
                 return segment_validation_result
             
-            # 6. Double check del polígono de mesa
+            # 7. Double check del polígono de mesa
             mesa_check_result = self._double_check_mesa_polygon(track, mesa)
             if not mesa_check_result["valid"]:
                 return "excluded", {
@@ -64,39 +97,54 @@ class PersonClassifier:
                     "mesa_check_reason": mesa_check_result["reason"],
                     "area_percentage": area_percentage_in_polygon,
                     "aspect_ratio": aspect_ratio,
-                    "speed": getattr(track, 'avg_speed', 0)
+                    "speed": track.avg_speed
                 }
             
-            # 7. Aceptar como customer
+            # 8. Aceptar como customer (cabeza/torso solo para los aceptados)
             return "customer", {
                 "area_percentage": area_percentage_in_polygon,
-                "head_in_roi": self._point_in_polygon(cx, y1 + h * 0.15, mesa.poly),
-                "torso_in_roi": self._point_in_polygon(cx, y1 + h * 0.4, mesa.poly),
+                "head_in_roi": self._point_in_polygon(cx, y1 + h * 0.15, mesa),
+                "torso_in_roi": self._point_in_polygon(cx, y1 + h * 0.4, mesa),
                 "aspect_ratio": aspect_ratio,
-                "speed": getattr(track, 'avg_speed', 0),
+                "speed": track.avg_speed,
                 "yolo_segment_validation": True
             }
         
-        # 8. Casos ambiguos -> Excluir
+        # 9. Casos ambiguos -> Excluir
         return "excluded", {
             "reason": "ambiguous_classification",
             "area_percentage": area_percentage_in_polygon,
             "aspect_ratio": aspect_ratio,
-            "speed": getattr(track, 'avg_speed', 0)
+            "speed": track.avg_speed
         }
     
-    def _calculate_intersection_area(self, person_rect, mesa_poly):
+    def _calculate_intersection_area(self, track, mesa):
         """Calcula área de intersección entre persona y mesa"""
+        # Polígono de mesa inválido (validado una vez en Mesa): sin área utilizable
+        if not mesa.poly_valid:
+            return 0
+        
+        x1, y1, x2, y2 = track.x1, track.y1, track.x2, track.y2
+        
+        # Rectángulo de la persona: se crea una vez y se reutiliza en todas las mesas
+        if track.rect is None:
+            track.rect = Polygon([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+        person_rect = track.rect
+        
+        # Gate con geometría preparada: la intersección exacta solo si se tocan
+        if not mesa.prepared.intersects(person_rect):
+            return 0
+        
         try:
-            intersection = person_rect.intersection(mesa_poly)
-            return intersection.area if intersection.is_valid else 0
-        except:
+            intersection = person_rect.intersection(mesa.poly)
+        except shapely.errors.GEOSException:
             return 0
+        return intersection.area if intersection.is_valid else 0
     
     def _apply_basic_filters(self, area_percentage, track, mesa, cx, cy):
         """Aplica filtros básicos de área, velocidad y banda vertical"""
         # Filtro de área mínima
-        min_area_percentage = 0.08
+        min_area_percentage = self.MIN_AREA_PERCENTAGE
         if area_percentage < min_area_percentage:
             return "excluded", {
                 "reason": "insufficient_area", 
@@ -105,8 +153,8 @@ class PersonClassifier:
             }
         
         # Filtro de velocidad (peatones muy rápidos)
-        avg_speed = getattr(track, 'avg_speed', 0)
-        if avg_speed > 80.0:
+        avg_speed = track.avg_speed
+        if avg_speed > self.MAX_AVG_SPEED:
             return "excluded", {
                 "reason": "moving_too_fast", 
                 "speed": avg_speed,
@@ -123,19 +171,19 @@ class PersonClassifier:
     
     def _analyze_posture(self, track, aspect_ratio, area_percentage):
         """Analiza postura para determinar si es staff (de pie) o walking"""
-        avg_speed = getattr(track, 'avg_speed', 0)
+        avg_speed = track.avg_speed
         
         # Detectar personas de pie con pies visibles
         is_standing_with_feet = False
-        if self.detector and hasattr(self.detector, 'is_person_standing_with_feet_visible'):
+        if self._standing_check is not None:
             try:
                 x1, y1, x2, y2 = track.xyxy
                 bbox = [x1, y1, x2, y2]
-                is_standing_with_feet = self.detector.is_person_standing_with_feet_visible(
+                is_standing_with_feet = self._standing_check(
                     self.current_frame, bbox
                 )
             except Exception as e:
-                print(f"Error YOLO Pose: {e}, usando fallback geométrico")
+                _log.warning("Error YOLO Pose: %s, usando fallback geométrico", e)
                 is_standing_with_feet = aspect_ratio > 2.0
         else:
             is_standing_with_feet = aspect_ratio > 2.5
@@ -157,20 +205,19 @@ class PersonClassifier:
     
     def _is_likely_seated(self, aspect_ratio, track):
         """Determina si una persona probablemente está sentada"""
-        avg_speed = getattr(track, 'avg_speed', 0)
+        avg_speed = track.avg_speed
         return aspect_ratio <= 2.0 and avg_speed < 12.0
     
     def _validate_customer_segment(self, track, area_percentage):
         """Validación secundaria del segmento con YOLO"""
-        if (self.detector and self.current_frame is not None and 
-            hasattr(self.detector, 'validate_person_segment')):
-            
+        if self._segment_check is not None and self.current_frame is not None:
             x1, y1, x2, y2 = track.xyxy
             bbox = [x1, y1, x2, y2]
-            is_complete_person = self.detector.validate_person_segment(self.current_frame, bbox)
+            is_complete_person = self._segment_check(self.current_frame, bbox)
             
             if not is_complete_person:
-                print(f"🚫 Rechazado track {track.id} - segmento no contiene persona completa")
+                if _log.isEnabledFor(logging.DEBUG):
+                    _log.debug("🚫 Rechazado track %s - segmento no contiene persona completa", track.id)
                 return "excluded", {
                     "reason": "segment_validation_failed",
                     "area_percentage": area_percentage,
@@ -184,25 +231,10 @@ class PersonClassifier:
         try:
             x1, y1, x2, y2 = track.xyxy
             
-            # Obtener bounding box del polígono de mesa
-            mesa_coords = mesa.polygon
-            mesa_x_coords = [coord[0] for coord in mesa_coords]
-            mesa_y_coords = [coord[1] for coord in mesa_coords]
-            
-            mesa_x_min = max(0, int(min(mesa_x_coords)))
-            mesa_y_min = max(0, int(min(mesa_y_coords)))
-            mesa_x_max = min(self.current_frame.shape[1], int(max(mesa_x_coords)))
-            mesa_y_max = min(self.current_frame.shape[0], int(max(mesa_y_coords)))
-            
-            # Validar bounds
-            if mesa_x_max <= mesa_x_min or mesa_y_max <= mesa_y_min:
-                return {"valid": True, "reason": "invalid_mesa_bounds"}
-            
-            # Extraer ROI de mesa
-            mesa_roi = self.current_frame[mesa_y_min:mesa_y_max, mesa_x_min:mesa_x_max]
-            
-            if mesa_roi.size == 0:
-                return {"valid": True, "reason": "empty_mesa_roi"}
+            # ROI de mesa del frame actual (compartido por todos sus tracks)
+            mesa_roi, mesa_x_min, mesa_y_min, roi_error = self._mesa_roi(mesa)
+            if roi_error is not None:
+                return {"valid": True, "reason": roi_error}
             
             # Ajustar coordenadas de persona al ROI
             person_x1_roi = max(0, x1 - mesa_x_min)
@@ -215,8 +247,8 @@ class PersonClassifier:
                 return {"valid": True, "reason": "person_outside_mesa_roi"}
             
             # Usar detector para análisis específico
-            if (self.detector and hasattr(self.detector, '_has_head_or_torso_in_mesa_roi')):
-                has_valid_body_parts = self.detector._has_head_or_torso_in_mesa_roi(
+            if self._mesa_roi_check is not None:
+                has_valid_body_parts = self._mesa_roi_check(
                     mesa_roi, 
                     person_x1_roi, person_y1_roi, 
                     person_x2_roi, person_y2_roi
@@ -230,10 +262,106 @@ class PersonClassifier:
                 return {"valid": True, "reason": "no_pose_detector"}
                 
         except Exception as e:
-            print(f"Error en double check de mesa: {e}")
+            _log.warning("Error en double check de mesa: %s", e)
             return {"valid": True, "reason": f"error_in_check: {str(e)}"}
     
-    def _point_in_polygon(self, x, y, polygon):
-        """Verifica si un punto está dentro del polígono"""
-        point = Point(x, y)
-        return polygon.contains(point)
+    def _mesa_roi(self, mesa):
+        """
+        Recorte del frame actual a la caja de la mesa, una vez por frame y
+        mesa. Devuelve (roi, x_min, y_min, error); error es el motivo si el
+        recorte no es utilizable.
+        """
+        cached = self._mesa_rois.get(mesa.id)
+        if cached is not None:
+            return cached
+        
+        # Bounding box del polígono de mesa (precalculado en Mesa) ajustada al frame
+        bx1, by1, bx2, by2 = mesa.bbox_int
+        mesa_x_min = max(0, bx1)
+        mesa_y_min = max(0, by1)
+        mesa_x_max = min(self.current_frame.shape[1], bx2)
+        mesa_y_max = min(self.current_frame.shape[0], by2)
+        
+        if mesa_x_max <= mesa_x_min or mesa_y_max <= mesa_y_min:
+            cached = (None, mesa_x_min, mesa_y_min, "invalid_mesa_bounds")
+        else:
+            mesa_roi = self.current_frame[mesa_y_min:mesa_y_max, mesa_x_min:mesa_x_max]
+            cached = (mesa_roi, mesa_x_min, mesa_y_min, None if mesa_roi.size else "empty_mesa_roi")
+        self._mesa_rois[mesa.id] = cached
+        return cached
+    
+    @staticmethod
+    def person_rects(boxes):
+        """Rectángulos de persona (N, 4) xyxy -> array de Polygon con una sola llamada"""
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        coords = np.stack([
+            np.column_stack([x1, y1]), np.column_stack([x2, y1]),
+            np.column_stack([x2, y2]), np.column_stack([x1, y2])
+        ], axis=1)
+        return shapely.polygons(coords)
+    
+    def intersection_areas(self, rects, boxes, mesa):
+        """
+        Versión vectorizada de _calculate_intersection_area para todos los
+        tracks frente a una mesa. Devuelve None si GEOS falla, para que el
+        llamador recurra al cálculo por track.
+        """
+        areas = np.zeros(len(rects), dtype=np.float64)
+        # Solo los rectángulos cuya caja envolvente toca la de la mesa
+        near = ((boxes[:, 2] > mesa.minx) & (boxes[:, 0] < mesa.maxx)
+                & (boxes[:, 3] > mesa.miny) & (boxes[:, 1] < mesa.maxy))
+        if not near.any() or not mesa.poly_valid:
+            return areas
+        
+        # Con Numba: Sutherland-Hodgman + shoelace, sin cruzar a GEOS
+        if HAS_NUMBA:
+            areas[near] = rect_clip_areas(mesa.poly_xy, boxes[near])
+            return areas
+        
+        try:
+            inter = shapely.intersection(rects[near], mesa.poly)
+        except shapely.errors.GEOSException:
+            return None
+        areas[near] = np.where(shapely.is_valid(inter), shapely.area(inter), 0.0)
+        return areas
+    
+    def basic_filter_mask(self, rects, boxes, avg_speeds, mesa):
+        """
+        Versión vectorizada de _apply_basic_filters para los candidatos de una
+        mesa. Los filtros baratos (caja, velocidad, banda) van primero y la
+        intersección con el polígono solo se calcula para los que los pasan.
+        Devuelve (keep, reason, inter_areas): keep indica si el track sigue a
+        la clasificación completa, reason el índice en BASIC_FILTER_REASONS
+        del primer filtro que falla (-1 si pasa) e inter_areas las áreas
+        (0 donde no se calcularon; None si GEOS falla y el área queda para
+        el cálculo por track).
+        """
+        person_area = np.abs((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))
+        passed = np.ones((len(self.BASIC_FILTER_REASONS), len(boxes)), dtype=bool)
+        passed[0] = person_area != 0
+        passed[1] = ~(avg_speeds > self.MAX_AVG_SPEED)
+        
+        # Banda vertical (si aplica) sobre el centro de la caja
+        if mesa.y_band:
+            y_min, y_max = mesa.y_band
+            cy = (boxes[:, 1] + boxes[:, 3]) / 2
+            passed[2] = (y_min <= cy) & (cy <= y_max)
+        
+        # Intersección solo para los que pasaron los filtros baratos
+        cheap = passed[0] & passed[1] & passed[2]
+        inter_areas = np.zeros(len(boxes), dtype=np.float64)
+        areas = self.intersection_areas(rects[cheap], boxes[cheap], mesa)
+        if areas is None:
+            inter_areas = None
+        else:
+            inter_areas[cheap] = areas
+            passed[3, cheap] = ~(areas / person_area[cheap] < self.MIN_AREA_PERCENTAGE)
+        
+        # Una sola reducción; el motivo sale del primer filtro fallido
+        keep = passed.all(axis=0)
+        reason = np.where(keep, -1, np.argmax(~passed, axis=0))
+        return keep, reason, inter_areas
+    
+    def _point_in_polygon(self, x, y, mesa):
+        """Verifica si un punto está dentro del polígono de la mesa (contains de Shapely)"""
+        return mesa.prepared.contains(Point(x, y))
@@ -2,13 +2,25 @@
 
 import cv2
 import sys
+import queue
+import logging
+import threading
+import contextlib
 from pathlib import Path
 
 # Importar módulos del sistema
-from config import parse_args, get_detection_params
+from config import parse_args, DETECTION_PARAMS
 from data_manager import DataManager
 from processor import VideoProcessor
 
+# Redimensionado de la ventana en GPU si OpenCV está compilado con CUDA
+try:
+    _CUDA_RESIZE = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    _CUDA_RESIZE = False
+# GpuMat persistentes: solo se realocan si cambia el tamaño del frame
+_GPU_BUFFERS = {}
+
 
 def main():
     """🎭 Orquestador principal - Coordina todos los componentes del sistema"""
@@ -21,6 +33,8 @@ def main():
         print("🚀 Iniciando sistema de detección de ocupación...")
         config = parse_args()
         print(f"DEBUG: Config obtenido: {config}")
+        if config.debug:
+            logging.basicConfig(level=logging.DEBUG, format="%(message)s")
         
         # 📊 2. Cargar datos
         print("📂 Cargando configuración...")
@@ -32,8 +46,10 @@ def main():
         
         # ⚙️ 3. Inicializar procesador
         print("⚙️ Configurando procesador...")
-        logic_params = get_detection_params()
-        processor = VideoProcessor(mesas, video_info, logic_params, config.conf_threshold)
+        logic_params = DETECTION_PARAMS
+        processor = VideoProcessor(mesas, video_info, logic_params, config.conf_threshold,
+                                   imgsz=config.imgsz, batch_size=config.batch_size,
+                                   quantize=config.int8)
         
         # 📹 4. Configurar salida de video
         out_writer = None
@@ -45,38 +61,63 @@ def main():
                 video_info['height']
             )
         
+        # Overlays solo donde el frame se consume: todos si se guarda el video,
+        # los que se muestran en la ventana si solo hay display, ninguno si no
+        if out_writer:
+            processor.overlay_stride = 1
+        else:
+            processor.overlay_stride = config.display_stride if config.display else 0
+        
         # 🎬 5. Procesar video
         print("▶️ Iniciando procesamiento...")
         cap = video_info['cap']
+        stopped = False
+        frame_idx = 0  # resultados recorridos: progreso y cadencia de la ventana
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Procesar frame
-            vis_frame, tracks = processor.process_frame(frame)
-            
-            # Mostrar progreso
-            if processor.should_show_progress():
-                progress = processor.get_progress_info()
-                print(f"🎬 Frame {progress['frame']}/{progress['total_frames']} ({progress['progress']:.1f}%) - {progress['fps']:.1f} fps")
-            
-            # Guardar frame
-            if out_writer:
-                out_writer.write(vis_frame)
-            
-            # Mostrar en ventana (opcional)
-            if config.display:
-                display_frame = _prepare_display_frame(vis_frame, video_info['width'])
-                cv2.imshow('Restaurant Vision Demo', display_frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    print("🛑 Detenido por usuario")
+        # Lotes de frames para la inferencia batched (1 = frame a frame),
+        # decodificados en un hilo aparte mientras se procesa el lote anterior
+        with contextlib.closing(_prefetch_batches(cap, config.batch_size)) as batches:
+            for frames in batches:
+                # Procesar frames
+                if len(frames) == 1:
+                    results = [processor.process_frame(frames[0])]
+                else:
+                    results = processor.process_batch(frames)
+                
+                for vis_frame, tracks in results:
+                    # Número de este resultado: con lotes, processor.frame_count
+                    # ya apunta al último frame del lote
+                    frame_idx += 1
+                    
+                    # Mostrar progreso
+                    if processor.should_show_progress(frame_idx):
+                        progress = processor.get_progress_info(frame_idx)
+                        print(f"🎬 Frame {progress['frame']}/{progress['total_frames']} ({progress['progress']:.1f}%) - {progress['fps']:.1f} fps")
+                    
+                    # Guardar frame
+                    if out_writer:
+                        out_writer.write(vis_frame)
+                    
+                    # Mostrar en ventana (opcional), uno de cada display_stride frames:
+                    # imshow/waitKey serializan el bucle con el hilo de la GUI
+                    if config.display and frame_idx % config.display_stride == 0:
+                        display_frame = _prepare_display_frame(vis_frame, video_info['width'])
+                        cv2.imshow('Restaurant Vision Demo', display_frame)
+                        if cv2.waitKey(1) & 0xFF == ord('q'):
+                            print("🛑 Detenido por usuario")
+                            stopped = True
+                            break
+                
+                if stopped:
                     break
         
         # 💾 6. Guardar resultados
         print("💾 Guardando resultados...")
         DataManager.save_events(processor.events, config.events_path)
+        if out_writer:
+            # Terminar la codificación aquí: un error del hilo del writer se
+            # reporta como error normal y no dentro del finally
+            out_writer.flush()
         
         # 📊 7. Mostrar estadísticas finales
         _show_final_stats(processor, config)
@@ -91,16 +132,85 @@ def main():
         _cleanup_resources(video_info.get('cap'), out_writer)
 
 
+def _read_batches(cap, batch_size):
+    """Lee el video en lotes de hasta batch_size frames (el último puede ser menor)"""
+    while True:
+        frames = []
+        while len(frames) < batch_size:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        if not frames:
+            return
+        yield frames
+        if len(frames) < batch_size:
+            return
+
+
+def _prefetch_batches(cap, batch_size, prefetch=4):
+    """
+    Igual que _read_batches, pero decodifica en un hilo aparte con hasta
+    prefetch lotes en cola: cap.read (OpenCV/PyAV libera el GIL) se solapa
+    con la inferencia y el render. Cerrar el generador detiene el hilo antes
+    de liberar el video.
+    """
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def reader():
+        try:
+            for frames in _read_batches(cap, batch_size):
+                if not put(frames):
+                    return
+        except Exception as e:
+            # Propagar el error de decodificación al hilo principal
+            put(e)
+        put(None)
+    
+    thread = threading.Thread(target=reader, name="frame-reader", daemon=True)
+    thread.start()
+    try:
+        while (item := batches.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
 def _prepare_display_frame(frame, original_width):
     """Preparar frame para visualización redimensionando si es necesario"""
     if original_width > 1280:
         scale = 1280 / original_width
         new_w = int(original_width * scale)
         new_h = int(frame.shape[0] * scale)
-        return cv2.resize(frame, (new_w, new_h))
+        if _CUDA_RESIZE:
+            return _cuda_resize(frame, (new_w, new_h))
+        # INTER_AREA: el modo recomendado para reducir (camino SIMD de OpenCV)
+        return cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
     return frame
 
 
+def _cuda_resize(frame, size):
+    """cv2.resize en GPU reutilizando los GpuMat de origen y destino"""
+    src = _GPU_BUFFERS.setdefault('src', cv2.cuda_GpuMat())
+    dst = _GPU_BUFFERS.setdefault('dst', cv2.cuda_GpuMat())
+    src.upload(frame)
+    cv2.cuda.resize(src, size, dst=dst, interpolation=cv2.INTER_AREA)
+    return dst.download()
+
+
 def _show_final_stats(processor, config):
     """Mostrar estadísticas finales del procesamiento"""
     stats = processor.get_final_stats()
@@ -118,7 +228,11 @@ def _cleanup_resources(cap, out_writer):
     if cap:
         cap.release()
     if out_writer:
-        out_writer.release()
+        try:
+            out_writer.release()
+        except Exception as e:
+            # No tapar la excepción original ni saltarse el cierre de ventanas
+            print(f"⚠️  Error cerrando el video de salida: {e}")
     cv2.destroyAllWindows()
 
 
@@ -1,22 +1,35 @@
 # processor.py — Motor de procesamiento principal
 import time
 from typing import List, Dict, Any, Optional
-from detector import PersonDetector
+from detector import PersonDetector, get_detector
 from tracker import SimpleTracker as PersonTracker
 from logic import OccupancyEngine, Mesa, LogicParams
 from visualization import render
+from data_manager import EventLog
 
 
 class VideoProcessor:
     """Procesador principal del video"""
     
-    def __init__(self, mesas: List[Mesa], video_info: Dict, logic_params: LogicParams, conf_threshold: float = 0.5):
+    def __init__(self, mesas: List[Mesa], video_info: Dict, logic_params: LogicParams, conf_threshold: float = 0.5,
+                 imgsz: int = 640, batch_size: int = 1, quantize: bool = False):
         self.mesas = mesas
         self.video_info = video_info
         
         # Inicializar componentes
-        self.detector = PersonDetector(conf=conf_threshold)
+        # Instancia compartida: los modelos se cargan una sola vez por proceso
+        self.detector = get_detector(conf_threshold, imgsz, quantize)
+        # Pagar el arranque lento de la primera inferencia antes del video
+        self.detector.warmup((video_info['height'], video_info['width']), batch=batch_size)
+        
+        # Precalcular bounds de ROI por mesa (polígonos estáticos)
+        frame_size = (video_info['height'], video_info['width'])
+        for mesa in mesas:
+            PersonDetector.mesa_roi_bounds(mesa, frame_size)
+        
         self.tracker = PersonTracker()
+        # Detección a ~10 Hz: entre detecciones el tracker solo predice
+        self.detect_stride = max(1, int(video_info['fps'] / 10))
         self.occupancy_engine = OccupancyEngine(
             mesas=mesas,
             frame_size=(video_info['height'], video_info['width']),
@@ -27,45 +40,94 @@ class VideoProcessor:
         # Estadísticas
         self.frame_count = 0
         self.start_time = time.time()
-        self.events = []
+        # Eventos en columnas tipadas (solo transiciones de estado por mesa)
+        self.events = EventLog([m.id for m in mesas])
+        # Fin del último lote (reparto del tiempo real entre sus frames)
+        self._last_batch_t = time.monotonic()
+        # Overlays (cajas, IDs de mesa) solo en los frames que se consumen:
+        # uno de cada overlay_stride frames; 0 = nunca (sin salida de video ni ventana)
+        self.overlay_stride = 1
     
     def process_frame(self, frame) -> tuple:
         """Procesar un frame individual"""
+        # Pipeline de procesamiento (detección y validaciones de pose/segmento
+        # del paso de ocupación comparten un solo inference_mode)
+        with self.detector.inference_mode():
+            detections = None
+            if self.frame_count % self.detect_stride == 0:
+                detections, _ = self.detector.process_frame(frame)
+            return self._process_detections(frame, detections)
+    
+    def process_batch(self, frames: List) -> List[tuple]:
+        """
+        Procesar varios frames con una sola inferencia batched. Tracker y
+        ocupación tienen estado y siguen frame a frame, cada uno con su
+        instante: el tiempo real del lote se reparte entre sus frames para
+        que velocidades y tiempos de sentado no vean ráfagas. Solo se
+        infieren los frames que tocan según detect_stride.
+        """
+        with self.detector.inference_mode():
+            key = [i for i in range(len(frames)) if (self.frame_count + i) % self.detect_stride == 0]
+            batch_dets = [None] * len(frames)
+            if key:
+                for i, dets in zip(key, self.detector.infer_batch([frames[i] for i in key])):
+                    batch_dets[i] = dets
+            
+            now = time.monotonic()
+            dt = (now - self._last_batch_t) / len(frames)
+            results = [
+                self._process_detections(frame, detections, self._last_batch_t + (i + 1) * dt)
+                for i, (frame, detections) in enumerate(zip(frames, batch_dets))
+            ]
+        self._last_batch_t = now
+        return results
+    
+    def _process_detections(self, frame, detections, t=None) -> tuple:
+        """
+        Tracking, ocupación, eventos y visualización de un frame ya detectado
+        (detections None: frame sin detección, el tracker solo predice)
+        """
         self.frame_count += 1
         current_time = self.frame_count / self.video_info['fps']
+        # Un solo instante monotónico por frame, compartido por tracker y ocupación
+        if t is None:
+            t = time.monotonic()
         
-        # Pipeline de procesamiento
-        detections = self.detector.infer(frame)
-        tracks = self.tracker.update(detections)
-        self.occupancy_engine.step(tracks, frame)
+        if detections is None:
+            tracks = self.tracker.predict(t)
+        else:
+            tracks = self.tracker.update(detections, t)
+        self.occupancy_engine.step(tracks, frame, t)
         
-        # Registrar eventos
-        for mesa in self.mesas:
-            self.events.append({
-                'frame': self.frame_count,
-                'time': current_time,
-                'mesa_id': mesa.id,
-                'occupied': mesa.occupied,
-                'people_seated': mesa.people_seated
-            })
+        # Registrar eventos (solo mesas que cambiaron)
+        self.events.append_frame(self.frame_count, current_time,
+                                 [m.occupied for m in self.mesas],
+                                 [m.people_seated for m in self.mesas])
         
         # Generar frame visualizado
-        vis_frame = render(frame, self.mesas, tracks)
+        stride = self.overlay_stride
+        draw_overlays = stride > 0 and self.frame_count % stride == 0
+        vis_frame = render(frame, self.mesas, tracks, draw_overlays=draw_overlays)
         
         return vis_frame, tracks
     
-    def should_show_progress(self, interval: int = 60) -> bool:
-        """Determinar si mostrar progreso"""
-        return self.frame_count % interval == 0
+    def should_show_progress(self, frame: Optional[int] = None, interval: int = 60) -> bool:
+        """
+        Determinar si mostrar progreso. frame: número del resultado (con
+        lotes, frame_count ya apunta al último frame del lote)
+        """
+        frame = self.frame_count if frame is None else frame
+        return frame % interval == 0
     
-    def get_progress_info(self) -> Dict[str, Any]:
-        """Obtener información de progreso"""
-        progress = self.frame_count / self.video_info['total_frames'] * 100
+    def get_progress_info(self, frame: Optional[int] = None) -> Dict[str, Any]:
+        """Obtener información de progreso (del resultado frame; por defecto, el último procesado)"""
+        frame = self.frame_count if frame is None else frame
+        progress = frame / self.video_info['total_frames'] * 100
         elapsed = time.time() - self.start_time
         fps_actual = self.frame_count / elapsed if elapsed > 0 else 0
         
         return {
-            'frame': self.frame_count,
+            'frame': frame,
             'total_frames': self.video_info['total_frames'],
             'progress': progress,
             'fps': fps_actual,
@@ -3,7 +3,7 @@
 print("🚀 Test básico iniciado")
 
 try:
-    from config import parse_args, get_detection_params
+    from config import parse_args, DETECTION_PARAMS
     print("✅ Config importado")
     
     from data_manager import DataManager
@@ -25,7 +25,7 @@ try:
     
     # Test detection params
     print("🔄 Obteniendo parámetros de detección...")
-    logic_params = get_detection_params()
+    logic_params = DETECTION_PARAMS
     print("✅ Parámetros obtenidos")
     
     # Test processor creation (this might be where it hangs)
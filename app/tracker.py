@@ -1,15 +1,22 @@
-# tracker.py — Tracker liviano NN + velocidad (sin dependencias externas)
+# tracker.py — Tracker liviano NN + velocidad (NumPy, Numba opcional)
 import time
 import math
+from collections import deque
+import numpy as np
+from detector import Detections
+from tracker_kernels import greedy_match, warmup
+
+SPEED_HISTORY_LEN = 10  # mediciones para suavizar la velocidad
 
 class Track:
-    __slots__ = ("id","xyxy","cx","cy","last_t","speed","age","hits","misses","speed_history","avg_speed")
+    __slots__ = ("id","xyxy","cx","cy","mx","my","vx","vy","last_t","speed","age","hits","misses","speed_history","_speed_sum","avg_speed")
     def __init__(self, tid, xyxy, t):
         self.id = tid
         self.age = 0
         self.hits = 0
         self.misses = 0
-        self.speed_history = []  # Historial de velocidades para suavizar
+        self.speed_history = deque(maxlen=SPEED_HISTORY_LEN)  # Historial de velocidades para suavizar
+        self._speed_sum = 0.0  # suma corrida del historial
         self.avg_speed = 0.0
         self.update(xyxy, t, init=True)
 
@@ -18,27 +25,43 @@ class Track:
         cx, cy = (x1+x2)/2.0, (y1+y2)/2.0
         if init:
             self.speed = 0.0
+            self.vx = self.vy = 0.0
         else:
+            # Velocidad respecto a la última medición (no a la posición predicha)
             dt = max(1e-3, t - self.last_t)
-            instant_speed = math.hypot(cx - self.cx, cy - self.cy) / dt
+            instant_speed = math.hypot(cx - self.mx, cy - self.my) / dt
+            self.vx = (cx - self.mx) / dt
+            self.vy = (cy - self.my) / dt
             
-            # Mantener historial de velocidades (últimas 10 mediciones)
+            # Mantener historial de velocidades (últimas 10 mediciones):
+            # el deque descarta la más antigua, que se resta de la suma corrida
+            if len(self.speed_history) == SPEED_HISTORY_LEN:
+                self._speed_sum -= self.speed_history[0]
             self.speed_history.append(instant_speed)
-            if len(self.speed_history) > 10:
-                self.speed_history = self.speed_history[-10:]
+            self._speed_sum += instant_speed
             
             # Calcular velocidad promedio y actual
-            self.avg_speed = sum(self.speed_history) / len(self.speed_history)
+            self.avg_speed = self._speed_sum / len(self.speed_history)
             self.speed = instant_speed
             
         self.xyxy = xyxy
-        self.cx = cx
-        self.cy = cy
+        self.cx = self.mx = cx
+        self.cy = self.my = cy
         self.last_t = t
         self.age += 1
         self.hits += 1
         self.misses = 0
 
+    def predict(self, t):
+        """Extrapola la caja a t con la última velocidad (sin tocar historial ni medición)"""
+        dt = t - self.last_t
+        dx = self.mx + self.vx * dt - self.cx
+        dy = self.my + self.vy * dt - self.cy
+        x1,y1,x2,y2 = self.xyxy
+        self.xyxy = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+        self.cx += dx
+        self.cy += dy
+
 class SimpleTracker:
     def __init__(self, max_dist=80.0, max_misses=30):  # Más tolerante para oclusiones
         self.max_dist = max_dist
@@ -46,26 +69,32 @@ class SimpleTracker:
         self._next_id = 1
         self.tracks = {}
         self.lost_tracks = {}  # Tracks perdidos que podrían reaparecer
+        # Buffers de centros reutilizados entre frames (crecen si hay más tracks)
+        self._active_xy = np.empty((128, 2), dtype=np.float64)
+        self._lost_xy = np.empty((128, 2), dtype=np.float64)
+        # Compilar el kernel de asociación ahora y no en el primer frame
+        warmup()
 
-    def update(self, detections):
-        """detections: [{'xyxy':(x1,y1,x2,y2),'conf':float}] -> lista de Track activos"""
-        t = time.time()
-        # Asociación greedy por distancia de centro
-        det_centers = [((d["xyxy"][0]+d["xyxy"][2])/2.0, (d["xyxy"][1]+d["xyxy"][3])/2.0) for d in detections]
-        unmatched = set(range(len(detections)))
+    def update(self, detections, t=None):
+        """
+        detections: Detections (o lista de {'xyxy':(x1,y1,x2,y2),'conf':float}) -> lista de Track activos
+        t: instante del frame (reloj monotónico); por defecto, ahora
+        """
+        if t is None:
+            t = time.monotonic()
+        if not isinstance(detections, Detections):
+            detections = Detections.from_dicts(detections)
+        # Asociación greedy por distancia de centro (kernel sobre arrays)
+        det_centers = detections.centers
+        unmatched = np.ones(len(detections), dtype=bool)
         
-        # Intentar asociar a cada track activo
-        for tid, tr in list(self.tracks.items()):
-            # buscar la detección más cercana
-            best_j, best_d = None, 1e9
-            for j in unmatched:
-                cx, cy = det_centers[j]
-                d = math.hypot(cx - tr.cx, cy - tr.cy)
-                if d < best_d:
-                    best_d, best_j = d, j
-            if best_j is not None and best_d <= self.max_dist:
-                tr.update(detections[best_j]["xyxy"], t, init=False)
-                unmatched.remove(best_j)
+        # Intentar asociar a cada track activo (en orden): la detección libre más cercana
+        active = list(self.tracks.items())
+        assign = greedy_match(self._centers(active, '_active_xy'), det_centers, self.max_dist)
+        for (tid, tr), j in zip(active, assign.tolist()):
+            if j >= 0:
+                tr.update(detections.box(j), t, init=False)
+                unmatched[j] = False
             else:
                 tr.misses += 1
                 # Si supera el límite, mover a tracks perdidos en lugar de eliminar
@@ -74,34 +103,60 @@ class SimpleTracker:
                     self.tracks.pop(tid, None)
 
         # Intentar reactivar tracks perdidos con detecciones no asignadas
-        for j in list(unmatched):
-            cx, cy = det_centers[j]
-            best_tid, best_d = None, 1e9
-            
-            # Buscar en tracks perdidos
-            for tid, tr in self.lost_tracks.items():
-                # Usar distancia más flexible para reactivación
-                d = math.hypot(cx - tr.cx, cy - tr.cy)
-                if d < best_d and d <= self.max_dist * 2.0:  # Distancia más flexible
-                    best_d, best_tid = d, tid
-            
-            if best_tid is not None:
-                # Reactivar track perdido
+        lost = list(self.lost_tracks.items())
+        if lost and unmatched.any():
+            free_js = np.flatnonzero(unmatched)
+            # Usar distancia más flexible para reactivación; cada detección
+            # libre (en orden) toma el track perdido disponible más cercano
+            revive = greedy_match(det_centers[free_js], self._centers(lost, '_lost_xy'),
+                                  self.max_dist * 2.0)
+            for j, k in zip(free_js.tolist(), revive.tolist()):
+                if k < 0:
+                    continue
+                
+                # Reactivar track perdido (ya no disponible para otras detecciones)
+                best_tid = lost[k][0]
                 reactivated_track = self.lost_tracks.pop(best_tid)
-                reactivated_track.update(detections[j]["xyxy"], t, init=False)
+                reactivated_track.update(detections.box(j), t, init=False)
                 reactivated_track.misses = 0  # Reset misses
                 self.tracks[best_tid] = reactivated_track
-                unmatched.remove(j)
+                unmatched[j] = False
 
         # Crear nuevos tracks para detecciones no asignadas
-        for j in unmatched:
+        for j in np.flatnonzero(unmatched):
             tid = self._next_id; self._next_id += 1
-            self.tracks[tid] = Track(tid, detections[j]["xyxy"], t)
+            self.tracks[tid] = Track(tid, detections.box(j), t)
 
         # Limpiar tracks perdidos muy antiguos (más de 60 segundos)
-        current_time = time.time()
         for tid in list(self.lost_tracks.keys()):
-            if current_time - self.lost_tracks[tid].last_t > 60.0:
+            if t - self.lost_tracks[tid].last_t > 60.0:
                 self.lost_tracks.pop(tid, None)
 
-        return list(self.tracks.values())
\ No newline at end of file
+        return list(self.tracks.values())
+
+    def predict(self, t=None):
+        """
+        Paso cinemático sin detecciones (frames entre detecciones): mueve los
+        tracks activos según su velocidad, sin asociar ni contar misses.
+        """
+        if t is None:
+            t = time.monotonic()
+        for tr in self.tracks.values():
+            tr.predict(t)
+        return list(self.tracks.values())
+
+    def _centers(self, items, buf_name):
+        """
+        Centros (len(items), 2) de los tracks de una lista (tid, track), escritos
+        en una vista del buffer buf_name (sin reservar memoria por frame)
+        """
+        buf = getattr(self, buf_name)
+        n = len(items)
+        if n > len(buf):
+            buf = np.empty((max(n, 2 * len(buf)), 2), dtype=np.float64)
+            setattr(self, buf_name, buf)
+        xy = buf[:n]
+        for i, (_, tr) in enumerate(items):
+            xy[i, 0] = tr.cx
+            xy[i, 1] = tr.cy
+        return xy
@@ -0,0 +1,66 @@
+# tracker_kernels.py — Asociación greedy del tracker (Numba opcional)
+import math
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def _greedy_match_numpy(a_xy, b_xy, max_dist):
+    """Matriz de distancias de una vez y argmin enmascarado por fila (fallback sin Numba)"""
+    out = np.full(a_xy.shape[0], -1, dtype=np.intp)
+    if not len(b_xy):
+        return out
+    dists = np.hypot(a_xy[:, None, 0] - b_xy[None, :, 0], a_xy[:, None, 1] - b_xy[None, :, 1])
+    free = np.ones(b_xy.shape[0], dtype=bool)
+    for i in range(a_xy.shape[0]):
+        if not free.any():
+            break
+        j = int(np.where(free, dists[i], np.inf).argmin())
+        if dists[i, j] <= max_dist:
+            out[i] = j
+            free[j] = False
+    return out
+
+
+if HAS_NUMBA:
+    @njit(cache=True, boundscheck=False)
+    def _greedy_match_numba(a_xy, b_xy, max_dist, out):
+        """Bucles escalares: distancias en registros, sin matriz temporal"""
+        taken = np.zeros(b_xy.shape[0], dtype=np.bool_)
+        for i in range(a_xy.shape[0]):
+            best, best_d = -1, np.inf
+            for j in range(b_xy.shape[0]):
+                if taken[j]:
+                    continue
+                d = math.hypot(a_xy[i, 0] - b_xy[j, 0], a_xy[i, 1] - b_xy[j, 1])
+                if d < best_d:
+                    best, best_d = j, d
+            if best >= 0 and best_d <= max_dist:
+                out[i] = best
+                taken[best] = True
+            else:
+                out[i] = -1
+
+
+def greedy_match(a_xy, b_xy, max_dist):
+    """
+    Asociación greedy por distancia de centro: cada fila de a_xy (N, 2), en
+    orden, toma el punto libre más cercano de b_xy (M, 2) (el primero si hay
+    empate) si está a <= max_dist. Devuelve (N,) con el índice en b o -1.
+    """
+    if not HAS_NUMBA:
+        return _greedy_match_numpy(a_xy, b_xy, max_dist)
+    out = np.empty(a_xy.shape[0], dtype=np.intp)
+    _greedy_match_numba(a_xy, b_xy, max_dist, out)
+    return out
+
+
+def warmup():
+    """Fuerza la compilación JIT al arrancar, no en el primer frame real"""
+    if HAS_NUMBA:
+        dummy = np.zeros((1, 2), dtype=np.float64)
+        greedy_match(dummy, dummy, 1.0)
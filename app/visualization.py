@@ -1,30 +1,97 @@
 # visualization.py — Panel superior: color por estado y conteo de personas
 import cv2
 import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Tuple, Optional
 
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Constantes de OpenCV resueltas una vez (no en cada llamada de texto)
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_AA = cv2.LINE_AA
+
 # ------------------------
 # Utilidades UI
 # ------------------------
+@lru_cache(maxsize=512)
+def _text_size(text: str, scale: float, thickness: int) -> Tuple[int, int]:
+    """(ancho, alto) del texto en FONT_HERSHEY_SIMPLEX; los textos se repiten entre frames"""
+    return cv2.getTextSize(text, _FONT, scale, thickness)[0]
+
+# Fondo de los IDs de mesa: disco blanco de radio 25 mezclado al 80 %.
+# Máscara del disco y LUT de la mezcla (misma aritmética que addWeighted)
+_BADGE_R = 25
+_BADGE_MASK = np.zeros((2 * _BADGE_R + 1, 2 * _BADGE_R + 1), dtype=np.uint8)
+cv2.circle(_BADGE_MASK, (_BADGE_R, _BADGE_R), _BADGE_R, 1, -1)
+_BADGE_MASK = _BADGE_MASK.astype(bool)
+_BADGE_LUT = cv2.addWeighted(np.full((1, 256), 255, np.uint8), 0.8,
+                             np.arange(256, dtype=np.uint8).reshape(1, 256), 0.2, 0).ravel()
+
+# Sprites del panel por contenido (título, textos y colores de filas)
+_PANEL_CACHE: "OrderedDict[tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+_PANEL_CACHE_SIZE = 64
+
 def _panel(img, title: str, rows: list, topleft=(12,12)):
     """
     rows: lista de dicts con:
       {"text": "T1 — 2 personas", "color": (B,G,R)}
+    El panel (sombra, fondo translúcido, textos) es una función lineal del
+    fondo por píxel: out = fondo * gain + offset. gain/offset se dibujan una
+    vez por contenido y cada frame solo compone la región del panel.
     """
+    key = (title, tuple(r["text"] for r in rows), tuple(r["color"] for r in rows))
+    sprite = _PANEL_CACHE.get(key)
+    if sprite is None:
+        sprite = _PANEL_CACHE[key] = _panel_sprite(title, rows)
+        if len(_PANEL_CACHE) > _PANEL_CACHE_SIZE:
+            _PANEL_CACHE.popitem(last=False)
+    else:
+        _PANEL_CACHE.move_to_end(key)
+    gain, offset = sprite
+
     x0, y0 = topleft
+    roi = img[y0:y0+gain.shape[0], x0:x0+gain.shape[1]]
+    h, w = roi.shape[:2]
+    roi[:] = np.clip(roi * gain[:h, :w] + offset[:h, :w] + 0.5, 0, 255)
+
+def _panel_sprite(title: str, rows: list):
+    """(gain, offset) float32 del panel, a partir de dibujarlo sobre fondo negro y blanco"""
+    w_box, h_box = _panel_size(title, rows)
+    # +3: la sombra se desplaza 2 px y los rectángulos incluyen su borde
+    black = np.zeros((h_box+3, w_box+3, 3), dtype=np.uint8)
+    white = np.full_like(black, 255)
+    _draw_panel(black, title, rows, w_box, h_box)
+    _draw_panel(white, title, rows, w_box, h_box)
+    offset = black.astype(np.float32)
+    gain = (white.astype(np.float32) - offset) / 255.0
+    return gain, offset
+
+def _panel_size(title: str, rows: list) -> Tuple[int, int]:
+    """(ancho, alto) de la caja del panel"""
     pad_x, pad_y = 8, 6  # Reducir padding
     line_h = 20  # Reducir altura de línea
     title_h = 22  # Reducir altura de título
-    font = cv2.FONT_HERSHEY_SIMPLEX
 
     # ancho máximo con fuentes más pequeñas
-    (tw,_), _ = cv2.getTextSize(title, font, 0.5, 1)  # Título más pequeño
+    tw, _ = _text_size(title, 0.5, 1)  # Título más pequeño
     max_w = tw
     for r in rows:
-        (w,_), _ = cv2.getTextSize(r["text"], font, 0.4, 1)  # Texto más pequeño
+        w, _ = _text_size(r["text"], 0.4, 1)  # Texto más pequeño
         max_w = max(max_w, w)
-    w_box = max_w + pad_x*2
-    h_box = title_h + len(rows)*line_h + pad_y*2 + 4
+    return max_w + pad_x*2, title_h + len(rows)*line_h + pad_y*2 + 4
+
+def _draw_panel(img, title: str, rows: list, w_box: int, h_box: int):
+    """Dibuja el panel con su esquina superior izquierda en (0, 0)"""
+    x0, y0 = 0, 0
+    pad_x, pad_y = 8, 6
+    line_h = 20
+    title_h = 22
+    font = _FONT
 
     # sombra más sutil
     shadow = img.copy()
@@ -38,11 +105,11 @@ def _panel(img, title: str, rows: list, topleft=(12,12)):
     cv2.addWeighted(overlay, 0.6, img, 0.4, 0, img)  # Más transparente
 
     # título más pequeño
-    cv2.putText(img, title, (x0+pad_x, y0+pad_y+title_h-6), font, 0.5, (40,40,40), 1, cv2.LINE_AA)
+    cv2.putText(img, title, (x0+pad_x, y0+pad_y+title_h-6), font, 0.5, (40,40,40), 1, _AA)
 
     # separador más sutil
     y = y0 + pad_y + title_h
-    cv2.line(img, (x0+pad_x, y+1), (x0+w_box-pad_x, y+1), (180,180,180), 1, cv2.LINE_AA)
+    cv2.line(img, (x0+pad_x, y+1), (x0+w_box-pad_x, y+1), (180,180,180), 1, _AA)
     y += 6
 
     # filas con texto más pequeño
@@ -51,10 +118,133 @@ def _panel(img, title: str, rows: list, topleft=(12,12)):
         # badge de color más pequeño
         cx = x0 + pad_x - 2
         cy = y - 10
-        cv2.circle(img, (cx, cy), 4, r["color"], -1, lineType=cv2.LINE_AA)
-        cv2.circle(img, (cx, cy), 4, (255,255,255), 1, lineType=cv2.LINE_AA)
+        cv2.circle(img, (cx, cy), 4, r["color"], -1, lineType=_AA)
+        cv2.circle(img, (cx, cy), 4, (255,255,255), 1, lineType=_AA)
         # texto más pequeño
-        cv2.putText(img, r["text"], (x0+pad_x+8, y-6), font, 0.4, (30,30,30), 1, cv2.LINE_AA)
+        cv2.putText(img, r["text"], (x0+pad_x+8, y-6), font, 0.4, (30,30,30), 1, _AA)
+
+if HAS_NUMBA:
+    @njit(cache=True, boundscheck=False)
+    def _draw_boxes_numba(frame, boxes, colors, radii):
+        """
+        Por track, en orden: contorno de la caja (boxes[k, :4]) con el grosor
+        de cv2.rectangle (banda de radio r y esquinas redondeadas) y fondo
+        sólido de la etiqueta (boxes[k, 4:], extremos incluidos), recortados al frame.
+        """
+        h, w = frame.shape[0], frame.shape[1]
+        for k in range(boxes.shape[0]):
+            x1, y1, x2, y2 = boxes[k, 0], boxes[k, 1], boxes[k, 2], boxes[k, 3]
+            if x1 > x2:
+                x1, x2 = x2, x1
+            if y1 > y2:
+                y1, y2 = y2, y1
+            r = radii[k]
+            b, g, rd = colors[k, 0], colors[k, 1], colors[k, 2]
+            for y in range(max(y1 - r, 0), min(y2 + r, h - 1) + 1):
+                if y1 + r < y < y2 - r:
+                    # Filas intermedias: solo las bandas laterales
+                    for x in range(max(x1 - r, 0), min(x1 + r, w - 1) + 1):
+                        frame[y, x, 0] = b; frame[y, x, 1] = g; frame[y, x, 2] = rd
+                    for x in range(max(x2 - r, 0), min(x2 + r, w - 1) + 1):
+                        frame[y, x, 0] = b; frame[y, x, 1] = g; frame[y, x, 2] = rd
+                    continue
+                dy = y1 - y if y < y1 else (y - y2 if y > y2 else 0)
+                for x in range(max(x1 - r, 0), min(x2 + r, w - 1) + 1):
+                    dx = x1 - x if x < x1 else (x - x2 if x > x2 else 0)
+                    if dx or dy:
+                        inside = dx * dx + dy * dy <= r * r
+                    else:
+                        inside = min(x - x1, x2 - x, y - y1, y2 - y) <= r
+                    if inside:
+                        frame[y, x, 0] = b; frame[y, x, 1] = g; frame[y, x, 2] = rd
+            
+            for y in range(max(boxes[k, 5], 0), min(boxes[k, 7], h - 1) + 1):
+                for x in range(max(boxes[k, 4], 0), min(boxes[k, 6], w - 1) + 1):
+                    frame[y, x, 0] = b; frame[y, x, 1] = g; frame[y, x, 2] = rd
+
+def _draw_boxes(frame, boxes, colors, thicknesses):
+    """
+    boxes: (x1, y1, x2, y2, lx1, ly1, lx2, ly2) por track (caja y fondo de
+    etiqueta). Con Numba, un solo kernel; si no, cv2.rectangle por track.
+    """
+    if HAS_NUMBA:
+        _draw_boxes_numba(frame, np.asarray(boxes, dtype=np.int32), np.asarray(colors, dtype=np.uint8),
+                          (np.asarray(thicknesses, dtype=np.int32) + 1) // 2)
+        return
+    for (x1, y1, x2, y2, lx1, ly1, lx2, ly2), color, thickness in zip(boxes, colors, thicknesses):
+        cv2.rectangle(frame, (x1,y1), (x2,y2), color, thickness)
+        cv2.rectangle(frame, (lx1, ly1), (lx2, ly2), color, -1)
+
+@lru_cache(maxsize=1024)
+def _text_pixels(text: str, scale: float, thickness: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Píxeles (dy, dx) int32, relativos al origen de cv2.putText, y cobertura
+    uint8 de cada uno: el texto se rasteriza una vez y cada frame solo se mezcla
+    """
+    (tw, th), baseline = cv2.getTextSize(text, _FONT, scale, thickness)
+    pad = th + 2 * thickness
+    buf = np.zeros((th + baseline + 2 * pad, tw + 2 * pad), dtype=np.uint8)
+    cv2.putText(buf, text, (pad, pad + th), _FONT, scale, 255, thickness)
+    ys, xs = np.nonzero(buf)
+    return (ys - (pad + th)).astype(np.int32), (xs - pad).astype(np.int32), buf[ys, xs]
+
+if HAS_NUMBA:
+    @njit(cache=True, boundscheck=False)
+    def _blit_texts_numba(frame, dy, dx, alpha, starts, orgs, colors):
+        """
+        Texto k, en orden: píxeles starts[k]:starts[k+1] en orgs[k], mezclados
+        con colors[k] según su cobertura y recortados al frame
+        """
+        h, w = frame.shape[0], frame.shape[1]
+        for k in range(orgs.shape[0]):
+            ox, oy = orgs[k, 0], orgs[k, 1]
+            for p in range(starts[k], starts[k + 1]):
+                y, x = oy + dy[p], ox + dx[p]
+                if 0 <= y < h and 0 <= x < w:
+                    a = np.int32(alpha[p])
+                    for c in range(3):
+                        frame[y, x, c] = (frame[y, x, c] * (255 - a) + colors[k, c] * a + 127) // 255
+
+def _draw_texts(frame, texts, scale: float, thickness: int):
+    """
+    texts: (texto, origen, color), todos con la misma escala y grosor. Con
+    Numba, la cobertura cacheada de cada texto se mezcla en un solo kernel
+    (difiere de cv2.putText en 1 nivel como mucho); si no, cv2.putText por texto.
+    """
+    if not HAS_NUMBA:
+        put_text, font = cv2.putText, _FONT
+        for text, org, color in texts:
+            put_text(frame, text, org, font, scale, color, thickness)
+        return
+    pixels = [_text_pixels(text, scale, thickness) for text, _, _ in texts]
+    starts = np.zeros(len(texts) + 1, dtype=np.intp)
+    starts[1:] = np.cumsum([len(px[0]) for px in pixels])
+    dy, dx, alpha = (np.concatenate(col) for col in zip(*pixels))
+    _blit_texts_numba(frame, dy, dx, alpha, starts,
+                      np.asarray([org for _, org, _ in texts], dtype=np.int32),
+                      np.asarray([color for _, _, color in texts], dtype=np.int32))
+
+# Etiquetas ya formateadas: (estado, décimas de px/s) y (prefijo, id) se repiten entre frames
+_LABEL_CACHE = {}
+_LABEL_CACHE_SIZE = 4096
+
+def _store_label(key, text: str) -> str:
+    if len(_LABEL_CACHE) >= _LABEL_CACHE_SIZE:
+        _LABEL_CACHE.clear()
+    _LABEL_CACHE[key] = text
+    return text
+
+def _status_text(state: str, speed_tenths: int) -> str:
+    """"<STATE> 12.3px/s" a partir de la velocidad en décimas"""
+    key = (state, speed_tenths)
+    text = _LABEL_CACHE.get(key)
+    return text if text is not None else _store_label(key, f"{state} {speed_tenths / 10:.1f}px/s")
+
+def _id_text(prefix: str, track_id: int) -> str:
+    """"ID:7" / "STAFF:7" """
+    key = (prefix, track_id)
+    text = _LABEL_CACHE.get(key)
+    return text if text is not None else _store_label(key, f"{prefix}{track_id}")
 
 def render_people(frame, tracks=None, show_people=True, mesas=None):
     """Dibuja cajas de personas con información de estado.
@@ -62,108 +252,142 @@ def render_people(frame, tracks=None, show_people=True, mesas=None):
     if not (show_people and tracks and mesas):
         return frame
     
-    # Crear conjuntos de IDs relevantes (staff + clientes en mesas)
-    relevant_track_ids = set()
-    all_staff_ids = set()
-    
+    # Rol de cada track relevante (staff gana sobre cliente): un solo lookup por track.
+    # Mesa siempre trae staff_tracks, tracks_in_area y people_seated: acceso directo
+    track_role = {}
     for mesa in mesas:
-        # Agregar staff
-        if hasattr(mesa, 'staff_tracks'):
-            all_staff_ids.update(mesa.staff_tracks)
-            relevant_track_ids.update(mesa.staff_tracks)
-        
-        # Agregar clientes sentados/válidos
-        if hasattr(mesa, 'tracks_in_area'):
-            for track_id in mesa.tracks_in_area:
-                if track_id not in all_staff_ids:  # No es staff
-                    relevant_track_ids.add(track_id)
+        for sid in mesa.staff_tracks:
+            track_role[sid] = "staff"
+    for mesa in mesas:
+        # Clientes sentados/válidos
+        for tid in mesa.tracks_in_area:
+            track_role.setdefault(tid, "client")
     
+    # Geometría y textos por track; el dibujo de cajas va en bloque al final
+    boxes, colors, thicknesses, texts = [], [], [], []
     for tr in tracks:
         # Solo mostrar tracks que son relevantes (staff o clientes válidos)
-        if tr.id not in relevant_track_ids:
+        role = track_role.get(tr.id)
+        if role is None:
             continue
             
         x1,y1,x2,y2 = map(int, tr.xyxy)
         
         # Determinar si es staff
-        is_staff = tr.id in all_staff_ids
+        is_staff = role == "staff"
         
         if is_staff:
             # Staff - siempre azul
             color = (255, 100, 0)  # Azul brillante
-            status = f"STAFF {tr.speed:.1f}px/s"
-            label_text = f"STAFF:{tr.id}"
+            status = _status_text("STAFF", round(tr.speed * 10))
+            label_text = _id_text("STAFF:", tr.id)
         else:
             # Cliente - color basado en velocidad
             if hasattr(tr, 'speed'):
                 if tr.speed < 12.0:  # Persona quieta/sentada
                     color = (0, 255, 0)  # Verde
-                    status = f"QUIET {tr.speed:.1f}px/s"
+                    status = _status_text("QUIET", round(tr.speed * 10))
                 else:
                     color = (0, 165, 255)  # Naranja
-                    status = f"MOVING {tr.speed:.1f}px/s"
+                    status = _status_text("MOVING", round(tr.speed * 10))
             else:
                 color = (255, 255, 255)  # Blanco por defecto
                 status = "TRACKING"
-            label_text = f"ID:{tr.id}"
+            label_text = _id_text("ID:", tr.id)
         
-        # Dibujar bbox con grosor diferente para staff
+        # Grosor diferente para staff; fondo de la etiqueta del ID
         thickness = 3 if is_staff else 2
-        cv2.rectangle(frame, (x1,y1), (x2,y2), color, thickness)
-        
-        # ID del track con fondo diferente para staff
         label_bg_y = max(10, y1 - 10)
         label_width = 140 if is_staff else 120
-        cv2.rectangle(frame, (x1, label_bg_y - 20), (x1 + label_width, label_bg_y), color, -1)
-        cv2.putText(frame, label_text, (x1 + 2, label_bg_y - 5), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255,255,255) if is_staff else (0,0,0), 1)
-        
+        boxes.append((x1, y1, x2, y2, x1, label_bg_y - 20, x1 + label_width, label_bg_y))
+        colors.append(color)
+        thicknesses.append(thickness)
+        texts.append((label_text, (x1 + 2, label_bg_y - 5), (255,255,255) if is_staff else (0,0,0)))
         # Estado de velocidad
-        cv2.putText(frame, status, (x1, y2 + 15), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+        texts.append((status, (x1, y2 + 15), color))
+    
+    if not boxes:
+        return frame
+    
+    # Cajas y fondos de etiqueta de todos los tracks en una sola llamada
+    _draw_boxes(frame, boxes, colors, thicknesses)
+    
+    # Textos encima (ID y estado de cada track), también en bloque
+    _draw_texts(frame, texts, 0.4, 1)
     
     return frame
 
-def render(frame, mesas, tracks=None, show_people=True, capacities: Optional[dict]=None):
+def _draw_mesa_ids(frame, mesas):
+    """ID de cada mesa sobre un disco blanco semitransparente en su centroide"""
+    # IDs en el centro de cada polígono: la unión de los
+    # discos de fondo se marca en una máscara del tamaño de la región que
+    # cubren y se mezcla una sola vez por LUT; el texto (opaco) después
+    labels = []
+    for mesa in mesas:
+        # Centroide del polígono (estático, precalculado en la mesa)
+        try:
+            cx, cy = mesa.centroid_px
+            labels.append((mesa.id, cx, cy))
+        except Exception as e:
+            print(f"Error dibujando mesa {mesa.id}: {e}")
+    
+    if labels:
+        r = _BADGE_R  # radio del fondo
+        h, w = frame.shape[:2]
+        xs = [cx for _, cx, _ in labels]
+        ys = [cy for _, _, cy in labels]
+        x_lo, y_lo = max(0, min(xs) - r), max(0, min(ys) - r)
+        x_hi, y_hi = min(w, max(xs) + r + 1), min(h, max(ys) + r + 1)
+        if x_lo < x_hi and y_lo < y_hi:
+            mask = np.zeros((y_hi - y_lo, x_hi - x_lo), dtype=bool)
+            for _, cx, cy in labels:
+                # Disco recortado a los bordes del frame (solapes: una sola mezcla)
+                bx0, by0 = max(0, cx - r), max(0, cy - r)
+                bx1, by1 = min(w, cx + r + 1), min(h, cy + r + 1)
+                if bx0 < bx1 and by0 < by1:
+                    mask[by0 - y_lo:by1 - y_lo, bx0 - x_lo:bx1 - x_lo] |= _BADGE_MASK[
+                        by0 - cy + r:by1 - cy + r, bx0 - cx + r:bx1 - cx + r]
+            # Fondo semi-transparente sin borde
+            roi = frame[y_lo:y_hi, x_lo:x_hi]
+            roi[mask] = _BADGE_LUT[roi[mask]]
+    
+    id_texts = []
+    for mesa_id, cx, cy in labels:
+        # ID de la mesa (sin borde gris)
+        text_size = _text_size(mesa_id, 0.7, 2)
+        text_x = cx - text_size[0] // 2
+        text_y = cy + text_size[1] // 2
+        id_texts.append((mesa_id, (text_x, text_y), (0, 0, 0)))
+        
+        # NO dibujar contorno del polígono para evitar distracción visual
+    if id_texts:
+        _draw_texts(frame, id_texts, 0.7, 2)
+
+def render(frame, mesas, tracks=None, show_people=True, capacities: Optional[dict]=None,
+           draw_overlays: bool = True):
     """
     Muestra panel con estado detallado de las mesas:
       • círculo rojo si m.occupied == True, verde si False
       • texto: "<ID> — <n> personas" (y si pasas capacities, muestra sillas libres)
+    draw_overlays=False omite cajas de personas e IDs de mesa (frame que no
+    se va a mostrar ni guardar); el panel se dibuja igual
     """
-    frame = render_people(frame, tracks, show_people=show_people, mesas=mesas)
-
-    # Dibujar IDs de mesas en el centro de cada polígono
-    for mesa in mesas:
-        # Calcular centroide del polígono
-        try:
-            centroid = mesa.poly.centroid
-            cx, cy = int(centroid.x), int(centroid.y)
-            
-            # Fondo semi-transparente sin borde
-            overlay = frame.copy()
-            cv2.circle(overlay, (cx, cy), 25, (255, 255, 255), -1)
-            cv2.addWeighted(overlay, 0.8, frame, 0.2, 0, frame)
-            
-            # ID de la mesa (sin borde gris)
-            text_size = cv2.getTextSize(mesa.id, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0]
-            text_x = cx - text_size[0] // 2
-            text_y = cy + text_size[1] // 2
-            cv2.putText(frame, mesa.id, (text_x, text_y), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
-            
-            # NO dibujar contorno del polígono para evitar distracción visual
-            
-        except Exception as e:
-            print(f"Error dibujando mesa {mesa.id}: {e}")
+    if draw_overlays:
+        frame = render_people(frame, tracks, show_people=show_people, mesas=mesas)
+        _draw_mesa_ids(frame, mesas)
 
     rows = []
     mesas_sorted = sorted(mesas, key=lambda m: str(m.id))
-    total_staff = 0
+    total_staff = total_occupied = total_people = 0
     
+    # Una sola pasada: filas y totales del encabezado
     for m in mesas_sorted:
-        ppl = int(getattr(m, "people_seated", 0) or 0)
-        staff_count = len(getattr(m, "staff_tracks", set()))
+        ppl = int(m.people_seated or 0)
+        staff_count = len(m.staff_tracks)
         total_staff += staff_count
+        total_people += ppl
+        if m.occupied:
+            total_occupied += 1
         
         # Color más intuitivo: rojo para ocupada, verde para libre
         if m.occupied:
@@ -189,9 +413,6 @@ def render(frame, mesas, tracks=None, show_people=True, capacities: Optional[dic
         rows.append({"text": text, "color": color})
 
     # Información adicional en el panel
-    total_occupied = sum(1 for m in mesas_sorted if m.occupied)
-    total_people = sum(getattr(m, "people_seated", 0) for m in mesas_sorted)
-    
     header_info = f"Ocupación: {total_occupied}/{len(mesas_sorted)} mesas | {total_people} clientes"
     _panel(frame, header_info, rows, topleft=(12,12))
     
@@ -2,11 +2,25 @@
 import argparse
 import os
 import sys
+import time
 import yaml
 import cv2
 import numpy as np
 from typing import List, Tuple, Optional
 
+try:
+    # libyaml (C), mucho más rápido
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+# Constantes de OpenCV resueltas una vez (no en cada llamada de dibujo)
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_AA = cv2.LINE_AA
+
+# Intervalo mínimo entre repintados (~30 fps); la entrada se consulta cada 1 ms
+_REDRAW_INTERVAL_S = 0.033
+
 # ------------------------------------------------------------
 # ROI Editor — dibuja polígonos (mesas) y guarda rois.yaml
 #
@@ -73,13 +87,20 @@ class ROIEditor:
         # Polígono actual en edición
         self.curr_pts: List[Tuple[int,int]] = []
 
-        # Lista de polígonos [(pts, id), ...]
-        self.polys: List[Tuple[List[Tuple[int,int]], str]] = []
+        # Lista de polígonos [(pts, id, pts int32, posición de etiqueta), ...];
+        # array y etiqueta se calculan una vez por polígono (ver _poly_entry)
+        self.polys: List[Tuple[List[Tuple[int,int]], str, np.ndarray, Tuple[int,int]]] = []
 
         if preload_polys:
             for i, poly in enumerate(preload_polys):
                 pid = preload_ids[i] if (preload_ids and i < len(preload_ids)) else f"T{i+1}"
-                self.polys.append((poly, pid))
+                self.polys.append(self._poly_entry(poly, pid))
+
+        # Capa con los polígonos guardados: se reconstruye solo cuando cambian
+        self._polys_layer: Optional[np.ndarray] = None
+        self._overlay_dirty = True
+        # Repintar solo tras un cambio (mouse/teclado); en reposo no se dibuja
+        self._needs_redraw = True
 
         # Para capturar texto cuando cerramos un polígono (ID de mesa)
         self.typing_id = False
@@ -96,6 +117,7 @@ class ROIEditor:
 
         if event == cv2.EVENT_LBUTTONDOWN:
             self.curr_pts.append((int(x), int(y)))
+            self._needs_redraw = True
         elif event == cv2.EVENT_RBUTTONDOWN:
             self.close_polygon()
 
@@ -105,40 +127,59 @@ class ROIEditor:
             # activa modo escritura de ID
             self.typing_id = True
             self.input_buffer = ""
+            self._needs_redraw = True
+
+    @staticmethod
+    def _poly_entry(poly, pid):
+        """Entrada de self.polys: puntos, ID, array int32 y etiqueta sobre el vértice más alto"""
+        top_pt = min(poly, key=lambda p: p[1])
+        label_pt = (int(top_pt[0]), max(20, int(top_pt[1]) - 6))
+        return poly, pid, np.asarray(poly, dtype=np.int32), label_pt
 
     def finish_current_polygon(self, pid: Optional[str] = None):
         if len(self.curr_pts) >= 3:
             if not pid or not pid.strip():
                 pid = f"T{len(self.polys)+1}"
-            self.polys.append((self.curr_pts.copy(), pid.strip()))
+            self.polys.append(self._poly_entry(self.curr_pts.copy(), pid.strip()))
             self.curr_pts.clear()
+            self._overlay_dirty = True
         self.typing_id = False
         self.input_buffer = ""
+        self._needs_redraw = True
 
     # --------- Dibujo ----------
-    def draw(self):
-        self.draw_img = self.base.copy()
-
-        # dibujar polígonos existentes
-        for i, (poly, pid) in enumerate(self.polys):
-            pts = np.array(poly, dtype=np.int32)
+    def _build_polys_layer(self):
+        """Imagen base con los polígonos guardados (relleno en una sola mezcla, contornos y etiquetas)"""
+        layer = self.base.copy()
+        if self.polys:
+            all_pts = [pts for _, _, pts, _ in self.polys]
             # relleno suave
-            overlay = self.draw_img.copy()
-            cv2.fillPoly(overlay, [pts], (0, 200, 0))
-            cv2.addWeighted(overlay, 0.25, self.draw_img, 0.75, 0, self.draw_img)
+            # (un fillPoly por polígono: con varios contornos a la vez los solapes quedan vacíos)
+            overlay = layer.copy()
+            for pts in all_pts:
+                cv2.fillPoly(overlay, [pts], (0, 200, 0))
+            cv2.addWeighted(overlay, 0.25, layer, 0.75, 0, layer)
             # contorno
-            cv2.polylines(self.draw_img, [pts], True, (0, 100, 0), 2, lineType=cv2.LINE_AA)
+            cv2.polylines(layer, all_pts, True, (0, 100, 0), 2, lineType=_AA)
             # etiqueta
-            top_pt = min(poly, key=lambda p: p[1])
-            cv2.putText(self.draw_img, pid, (top_pt[0], max(20, top_pt[1]-6)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (15,15,15), 2, cv2.LINE_AA)
+            for _, pid, _, label_pt in self.polys:
+                cv2.putText(layer, pid, label_pt,
+                            _FONT, 0.7, (15,15,15), 2, _AA)
+        self._polys_layer = layer
+        self._overlay_dirty = False
+
+    def draw(self):
+        # polígonos existentes: capa cacheada
+        if self._overlay_dirty or self._polys_layer is None:
+            self._build_polys_layer()
+        self.draw_img = self._polys_layer.copy()
 
         # polígono en edición
         if self.curr_pts:
             pts = np.array(self.curr_pts, dtype=np.int32)
             for p in self.curr_pts:
-                cv2.circle(self.draw_img, p, 3, (0, 0, 255), -1, lineType=cv2.LINE_AA)
-            cv2.polylines(self.draw_img, [pts], False, (0, 0, 255), 2, lineType=cv2.LINE_AA)
+                cv2.circle(self.draw_img, p, 3, (0, 0, 255), -1, lineType=_AA)
+            cv2.polylines(self.draw_img, [pts], False, (0, 0, 255), 2, lineType=_AA)
 
         # overlay de input si estamos solicitando ID
         if self.typing_id:
@@ -147,30 +188,39 @@ class ROIEditor:
 
     def _draw_centered_banner(self, text: str):
         h, w = self.draw_img.shape[:2]
-        (tw, th), bl = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+        (tw, th), bl = cv2.getTextSize(text, _FONT, 0.9, 2)
         x = (w - tw) // 2
         y = 40
         cv2.rectangle(self.draw_img, (x-10, y-th-10), (x+tw+10, y+10), (255,255,255), -1)
-        cv2.putText(self.draw_img, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (20,20,20), 2, cv2.LINE_AA)
+        cv2.putText(self.draw_img, text, (x, y), _FONT, 0.9, (20,20,20), 2, _AA)
 
     # --------- Persistencia ----------
     def save_yaml(self):
         data = {
             "tables": [
                 {"id": pid, "polygon": [[int(x), int(y)] for (x, y) in poly]}
-                for (poly, pid) in self.polys
+                for (poly, pid, _, _) in self.polys
             ]
         }
         with open(self.out_path, "w") as f:
-            yaml.safe_dump(data, f, sort_keys=False)
+            yaml.dump(data, f, Dumper=SafeDumper, sort_keys=False)
         print(f"[guardado] {self.out_path}")
 
     # --------- Loop principal ----------
     def run(self):
+        last_draw = 0.0
         while True:
-            self.draw()
-            cv2.imshow(self.window, self.draw_img)
-            key = cv2.waitKey(20) & 0xFF
+            # Repintar como mucho una vez por intervalo (varios eventos se agrupan)
+            now = time.monotonic()
+            if self._needs_redraw and now - last_draw > _REDRAW_INTERVAL_S:
+                self.draw()
+                cv2.imshow(self.window, self.draw_img)
+                last_draw = now
+                self._needs_redraw = False
+            key = cv2.waitKey(1) & 0xFF
+            if key != 255:
+                # Cualquier tecla puede cambiar el estado (buffer de ID, puntos, polígonos)
+                self._needs_redraw = True
 
             # Captura de texto para el ID del polígono
             if self.typing_id:
@@ -196,6 +246,7 @@ class ROIEditor:
             elif key == ord('d'):
                 if self.polys:
                     self.polys.pop()
+                    self._overlay_dirty = True
             elif key == ord('s'):
                 # cerrar polígono abierto (si tiene >=3 puntos) antes de guardar
                 if len(self.curr_pts) >= 3:
@@ -216,7 +267,7 @@ def load_preload_yaml(path: str):
     if not path or not os.path.exists(path):
         return None, None
     with open(path, "r") as f:
-        data = yaml.safe_load(f) or {}
+        data = yaml.load(f, Loader=SafeLoader) or {}
     polys, ids = [], []
     for t in data.get("tables", []):
         poly = [(int(x), int(y)) for x, y in t.get("polygon", [])]